@@ -0,0 +1,125 @@
+# compares parse_md() of level_packs.convert2plaintxt, cleaning lines in a single regex pass,
+# with the previous .replace() chains.
+# the corpus is either a folder of lesson docx files, converted once with pandoc,
+# a folder of pandoc plain text dumps (.txt) or, without argument, generated dumps.
+# run from the repo root: python benchmarks/bench_cleanup.py [folder]
+import random
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from level_packs.convert2plaintxt import parse_md, separate_tables
+
+SYLLABLES = ['ཀ', 'ཁ', 'ག', 'ང', 'བཀྲ', 'ཤིས', 'བདེ', 'ལེགས', 'སློབ', 'གྲྭ']
+# footnote marks, quotes... that the cleanup removes
+MARKED = ['[1]', '“སློབ”', 'a/b', '-']
+
+
+def old_clean(e):
+    return e.replace('-', '').replace('[', '').replace(']', '').replace('|', '').replace('/', '').replace('“', '').replace('”', '').strip()
+
+
+def old_parse_md(string):
+    parsed_text = []
+    for type_, el in separate_tables(string):
+        if type_ == 'table':
+            parsed_text.extend(old_parse_table(el))
+        else:
+            parsed_text.extend(old_clean(e) for e in el)
+    return parsed_text
+
+
+def old_parse_table(table):
+    sections = []
+    section = []
+    for line in table:
+        if line.startswith('+') and section:
+            sections.append(section)
+            section = []
+        section.append(line)
+
+    def parse_header(header):
+        parts = []
+        prev, cur = 0, 0
+        for n, s in enumerate(header):
+            if s == '+':
+                if cur == 0:
+                    cur += 1
+                    continue
+                parts.append((prev + 1, cur))
+                prev = cur
+            else:
+                cur += 1
+        return parts
+
+    txt = []
+    for section in sections:
+        header, body = section[0], section[1:]
+        parts = parse_header(header)
+        strings = defaultdict(list)
+        for line in body:
+            for n, (start, end) in enumerate(parts):
+                strings[n].append(old_clean(line[start:end]))
+        for string in strings.values():
+            txt.append(''.join(string))
+    return txt
+
+
+def sentence(rand, n):
+    return '་'.join(rand.choice(MARKED if rand.random() < 0.03 else SYLLABLES) for _ in range(n))
+
+
+def generated_dump(rand):
+    lines = []
+    for _ in range(rand.randint(10, 30)):
+        lines.extend([sentence(rand, 12), sentence(rand, 8), ''])
+    widths = [rand.randint(15, 35) for _ in range(3)]
+    border = '+' + '+'.join('-' * w for w in widths) + '+'
+    lines.append(border)
+    for _ in range(rand.randint(5, 15)):
+        for _ in range(2):
+            lines.append('|' + '|'.join(' ' + sentence(rand, 3).ljust(w - 1)[:w - 1] for w in widths) + '|')
+        lines.append(border)
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def load_corpus(folder):
+    if not folder:
+        rand = random.Random(1)
+        return [generated_dump(rand) for _ in range(300)]
+    dumps = [f.read_text(encoding='utf-8') for f in sorted(folder.glob('*.txt'))]
+    docx = sorted(folder.glob('*.docx'))
+    if docx:
+        from level_packs.pandoc_batch import pandoc_dumps
+        dumps.extend(pandoc_dumps(docx))
+    return dumps
+
+
+def measure(func, dumps, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for dump in dumps:
+            func(dump)
+        secs = time.perf_counter() - start
+        best = secs if best is None else min(best, secs)
+    return best
+
+
+def main():
+    dumps = load_corpus(Path(sys.argv[1]) if len(sys.argv) > 1 else None)
+    lines = sum(len(d.split('\n')) for d in dumps)
+    assert all(parse_md(d) == old_parse_md(d) for d in dumps), 'outputs differ'
+
+    old = measure(old_parse_md, dumps)
+    new = measure(parse_md, dumps)
+    print(f'{len(dumps)} dumps, {lines} lines')
+    print(f'replace chains: {old:.3f}s ({old / lines * 1e6:.2f}µs per line)')
+    print(f'compiled regex: {new:.3f}s ({new / lines * 1e6:.2f}µs per line)')
+
+
+if __name__ == '__main__':
+    main()
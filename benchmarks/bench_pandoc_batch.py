@@ -0,0 +1,60 @@
+# compares one pandoc process per file with the batch conversion of level_packs.pandoc_batch
+# on a corpus of generated lesson-like docx files. needs pandoc 3+ for the server mode.
+# run from the repo root: python benchmarks/bench_pandoc_batch.py [number of files]
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from docx import Document
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from level_packs.pandoc_batch import convert_docx, ensure_pandoc, pandoc_dumps
+
+SYLLABLES = ['ཀ', 'ཁ', 'ག', 'ང', 'བཀྲ', 'ཤིས', 'བདེ', 'ལེགས', 'སློབ', 'གྲྭ']
+
+
+def sentence(rand):
+    return '་'.join(rand.choice(SYLLABLES) for _ in range(rand.randint(4, 20))) + '། '
+
+
+def make_corpus(folder, n, seed=1):
+    rand = random.Random(seed)
+    files = []
+    for i in range(n):
+        doc = Document()
+        for _ in range(rand.randint(5, 20)):
+            doc.add_paragraph(''.join(sentence(rand) for _ in range(rand.randint(1, 6))))
+        table = doc.add_table(rows=rand.randint(2, 6), cols=2)
+        for row in table.rows:
+            for cell in row.cells:
+                cell.text = sentence(rand)
+        f = folder / f'{i // 10 + 1}-{i % 10}.docx'
+        doc.save(f)
+        files.append(f)
+    return files
+
+
+def timed(label, func, n):
+    start = time.perf_counter()
+    result = func()
+    secs = time.perf_counter() - start
+    print(f'{label:<28}{secs:8.2f}s  {secs / n * 1000:7.1f}ms per file')
+    return result
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    ensure_pandoc()
+    with tempfile.TemporaryDirectory() as tmp:
+        files = make_corpus(Path(tmp), n)
+        print(f'{n} files')
+        expected = timed('one pandoc per file', lambda: [convert_docx(f) for f in files], n)
+        threads = timed('thread pool', lambda: list(pandoc_dumps(files, server=False)), n)
+        server = timed('pandoc server', lambda: list(pandoc_dumps(files)), n)
+    print('same output:', threads == expected, server == expected)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# compares the streaming parsers of level_packs.utils with the previous full-DOM parsing
+# on generated workbooks. run from the repo root: python benchmarks/bench_parse_xlsx.py
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+
+from openpyxl import Workbook, load_workbook
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from level_packs.utils import parse_vocab, parse_tagged_sentences
+
+
+def dom_parse_vocab(filepath):
+    wb = load_workbook(Path(filepath))
+    total = {}
+    for sheet in wb.worksheets:
+        cols = [[cell.value for cell in col] for col in sheet.columns if col[0].value]
+        triples = {}
+        for i in range(0, len(cols), 3):
+            current = None
+            legend = None
+            tr = []
+            for j in range(len(cols[i])):
+                a, b, c = cols[i][j], cols[i + 1][j], cols[i + 2][j]
+                if j == 0:
+                    legend = (a, b, c)
+                    current = a
+                elif a:
+                    tr.append((a, b, c))
+            if tr:
+                triples[current] = {'legend': legend, 'words': tr}
+        if triples:
+            total[sheet.title] = triples
+    return total
+
+
+def dom_parse_tagged_sentences(tagged_path):
+    parsed = {}
+    for f in tagged_path.glob('*.xlsx'):
+        wb = load_workbook(f)
+        for sheet in wb.worksheets:
+            title = sheet.title
+            if not 'sentences' in title:
+                continue
+            if title not in parsed:
+                parsed[title] = defaultdict(int)
+
+            rows = [[cell.value for cell in row] for row in sheet.rows]
+            for i in range(0, len(rows), 4):
+                words = [r for r in rows[i] if r]
+                pos = [r for r in rows[i+1] if r]
+                pairs = tuple(zip(words, pos))
+                parsed[title][pairs] += 1
+    return parsed
+
+
+def make_tagged(path, n_files, n_sents):
+    syls = ['ཀ', 'ཁ', 'ག', 'ང', 'ཅ', 'ཆ', 'ཇ', 'ཉ', 'ཏ', 'ཐ']
+    tags = ['NOUN', 'VERB', 'PART', 'ADJ']
+    for n in range(n_files):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = f'L{n}-a_sentences'
+        for _ in range(n_sents):
+            length = random.randint(3, 15)
+            ws.append([''.join(random.choices(syls, k=2)) + '་' for _ in range(length)])
+            ws.append(random.choices(tags, k=length))
+            ws.append([None])
+            ws.append([None])
+        wb.save(path / f'L{n}-a_totag.xlsx')
+
+
+def make_vocab(path, n_rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'A0'
+    ws.append(['L1', 'POS', 'CAT', 'L2', 'POS', 'level'])
+    for i in range(n_rows):
+        ws.append([f'word{i}', 'NOUN', None, f'other{i}', None, 'A0'])
+    wb.save(path)
+
+
+def measure(func, *args):
+    # timed without tracemalloc, which slows down allocations a lot
+    start = time.perf_counter()
+    result = func(*args)
+    duration = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, duration, peak
+
+
+def compare(name, old, new, args):
+    old_res, old_time, old_peak = measure(old, *args)
+    new_res, new_time, new_peak = measure(new, *args)
+    same = old_res == new_res
+    print(f'{name}: {old_time:.2f}s / {old_peak / 2**20:.1f}MB -> {new_time:.2f}s / {new_peak / 2**20:.1f}MB'
+          f' ({old_time / new_time:.1f}x faster, same output: {same})')
+    return same
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        make_tagged(tmp, n_files=3, n_sents=3000)
+        make_vocab(tmp / 'vocab.xlsx', n_rows=10000)
+        ok = compare('parse_tagged_sentences', dom_parse_tagged_sentences, parse_tagged_sentences, (tmp,))
+        ok &= compare('parse_vocab', dom_parse_vocab, parse_vocab, (tmp / 'vocab.xlsx',))
+    sys.exit(0 if ok else 1)
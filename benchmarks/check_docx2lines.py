@@ -0,0 +1,69 @@
+# checks that the native docx reader of level_packs.convert2plaintxt gives the same lines as the pandoc path.
+# the pandoc results are kept as golden files, so the check can run again without pandoc.
+# the native reader is only used with native_docx: true in config.yaml, which should not be set before this check passes.
+# tests/test_convert2plaintxt.py runs the same comparison on the small files of tests/fixtures/docx2lines.
+# run from the repo root:
+#   python benchmarks/check_docx2lines.py "content/A0/1 docx-raw" --update   (writes the golden files with pandoc)
+#   python benchmarks/check_docx2lines.py "content/A0/1 docx-raw"            (compares docx2lines() to them)
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from level_packs.convert2plaintxt import docx2lines, parse_md
+
+
+def pandoc_lines(in_file):
+    import pypandoc
+    return parse_md(pypandoc.convert_file(str(in_file), 'plain', format='docx'))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('folder', type=Path, help='folder of .docx files')
+    parser.add_argument('--golden', type=Path, help='folder of the golden files, default: <folder>/golden')
+    parser.add_argument('--update', action='store_true', help='write the golden files with pandoc')
+    args = parser.parse_args()
+
+    golden = args.golden or args.folder / 'golden'
+    golden.mkdir(exist_ok=True)
+    files = sorted(args.folder.glob('*.docx'))
+
+    if args.update:
+        start = time.perf_counter()
+        for f in files:
+            (golden / (f.stem + '.txt')).write_text('\n'.join(pandoc_lines(f)), encoding='utf-8')
+        print(f'{len(files)} golden files written in {time.perf_counter() - start:.2f}s')
+        return
+
+    same, different, fallback, missing = 0, 0, 0, 0
+    start = time.perf_counter()
+    for f in files:
+        expected = golden / (f.stem + '.txt')
+        if not expected.is_file():
+            missing += 1
+            continue
+        lines = docx2lines(f)
+        if lines is None:
+            fallback += 1
+            continue
+        expected = expected.read_text(encoding='utf-8').split('\n')
+        if lines == expected:
+            same += 1
+            continue
+        different += 1
+        for n, (a, b) in enumerate(zip(lines, expected)):
+            if a != b:
+                print(f'{f.name}, line {n + 1}:\n\tnative: {a!r}\n\tpandoc: {b!r}')
+                break
+        else:
+            print(f'{f.name}: {len(lines)} lines instead of {len(expected)}')
+
+    print(f'{same} identical, {different} different, {fallback} left to pandoc, {missing} without golden file '
+          f'({time.perf_counter() - start:.2f}s)')
+    sys.exit(1 if different else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,8 +5,8 @@ from .create_pack import create_pack
 from .vocab_report import gen_vocab_report
 
 
-def create_packs():
-    mode, lang, content, driver_folders, level_colors, pos, levels, legend, line_mode = read_config()
+def create_packs(dry_run=False):
+    mode, lang, content, driver_folders, level_colors, pos, levels, legend, line_mode, workers, profile, native = read_config()
     content = Path(content)
     create_pack(
         content,
@@ -17,7 +17,11 @@ def create_packs():
         pos=pos,
         levels=levels,
         legend=legend,
-        line_mode=line_mode
+        line_mode=line_mode,
+        workers=workers,
+        profile=profile,
+        native=native,
+        dry_run=dry_run
     )
 
 
@@ -55,6 +59,9 @@ drive_folders:
         struct["levels"],
         struct["legend_template"],
         struct["line_mode"],
+        struct.get("workers", {}),
+        struct.get("profile", {}),
+        struct.get("native_docx", False),
     )
 
 
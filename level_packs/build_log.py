@@ -0,0 +1,113 @@
+import hashlib
+import json
+import shutil
+import time
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class BuildLog:
+    # remembers which inputs each output was built from, and how long each kind of step takes.
+    # an output is stale when it is missing or when its inputs changed since it was built.
+    # inputs whose mtime and size are unchanged are not hashed again.
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+        self.backed_up = set()
+        if path.is_file():
+            try:
+                self.data = json.loads(path.read_text())
+            except ValueError:
+                pass
+        if not self.data or self.data.get('version') != self.version:
+            self.data = {'version': self.version, 'outputs': {}, 'rates': {}}
+
+    def is_stale(self, output, inputs):
+        inputs = [i for i in inputs if i.is_file()]
+        if not output.is_file():
+            return True
+
+        record = self.data['outputs'].get(str(output))
+        if not record:
+            # built before the log existed: fall back on timestamps
+            mtime = output.stat().st_mtime_ns
+            return any(i.stat().st_mtime_ns > mtime for i in inputs)
+
+        if sorted(str(i) for i in inputs) != sorted(record['inputs']):
+            return True
+        for i in inputs:
+            if self._changed(i, record['inputs'][str(i)]):
+                return True
+        return False
+
+    @staticmethod
+    def _changed(path, known):
+        st = path.stat()
+        if st.st_mtime_ns == known['mtime'] and st.st_size == known['size']:
+            return False
+        if file_hash(path) != known['sha1']:
+            return True
+        # only touched: remember the new timestamp to avoid hashing it again
+        known['mtime'] = st.st_mtime_ns
+        return False
+
+    def record(self, output, inputs, kind=None, duration=None):
+        self.data['outputs'][str(output)] = {
+            'inputs': {str(i): self._stat(i) for i in inputs if i.is_file()},
+            'output': self._stat(output),
+        }
+        if kind and duration is not None:
+            seconds, size = self.data['rates'].get(kind, (0, 0))
+            size += sum(i.stat().st_size for i in inputs if i.is_file())
+            self.data['rates'][kind] = (seconds + duration, size)
+
+    @staticmethod
+    def _stat(path):
+        st = path.stat()
+        return {'mtime': st.st_mtime_ns, 'size': st.st_size, 'sha1': file_hash(path)}
+
+    def was_edited(self, output):
+        # True if the output was modified since it was built, typically by hand
+        record = self.data['outputs'].get(str(output))
+        if not record or not output.is_file():
+            return False
+        return self._changed(output, record['output'])
+
+    def backup(self, output, always=False):
+        # keeps a copy of a stale output before it is rebuilt if it may contain manual changes:
+        # if it was edited since it was built, or if it was built before the log existed
+        if not output.is_file() or output in self.backed_up:
+            return
+        if always:
+            reason = 'is rebuilt'
+        elif str(output) not in self.data['outputs']:
+            reason = 'is not in the build log'
+        elif self.was_edited(output):
+            reason = 'was edited since it was built'
+        else:
+            return
+        # one copy per version of the output, named after its modification time, so no earlier copy is overwritten
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(output.stat().st_mtime))
+        bak = output.parent / f'{output.name}.{stamp}.bak'
+        if not bak.is_file():
+            print(f'\t{output.name} {reason}. Saving a copy in {bak.name}')
+            shutil.copy2(output, bak)
+        self.backed_up.add(output)
+
+    def estimate(self, kind, inputs):
+        # estimated duration in seconds from the previous runs, None if unknown
+        seconds, size = self.data['rates'].get(kind, (0, 0))
+        if not size:
+            return None
+        return seconds / size * sum(i.stat().st_size for i in inputs if i.is_file())
+
+    def save(self):
+        self.path.write_text(json.dumps(self.data, ensure_ascii=False))
@@ -1,21 +1,65 @@
+import re
+import unicodedata
 from collections import defaultdict
 
-import pypandoc
 from docx import Document
 from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml.ns import qn
 from docx.shared import RGBColor
 
+from .pandoc_batch import convert_docx, ensure_pandoc, pandoc_dumps
+from .profiling import count
+
+# width at which pandoc wraps its plain text output
+COLUMNS = 72
+# characters removed from the converted text
+CLEANUP = re.compile(r'[-\[\]|/“”]')
+
+
+def convert2plaintxt(in_file, out_file, native=False):
+    # native: read the docx directly, only calling pandoc for the documents docx2lines() can't handle.
+    # off by default until benchmarks/check_docx2lines.py finds no difference with pandoc on the lesson files
+    txt = docx2lines(in_file) if native else None
+    if txt is None:
+        ensure_pandoc()
+        txt = parse_md(convert_docx(in_file))
+    write_textonly(txt, out_file)
+
+
+def convert_native(in_file, out_file):
+    # converts with docx2lines() only. returns False, leaving no out_file, for the documents it can't handle
+    txt = docx2lines(in_file)
+    if txt is None:
+        if out_file.is_file():
+            out_file.unlink()
+        return False
+    write_textonly(txt, out_file)
+    return True
+
+
+def convert_pandoc(in_file, out_file, fallback=False):
+    return next(convert_batch([(in_file, out_file, fallback)]))
 
-def convert2plaintxt(in_file, out_file):
-    # download pandoc if missing
-    try:
-        pypandoc.get_pandoc_path()
-    except OSError:
-        print('pandoc is not installed. Installing pandoc...')
-        pypandoc.download_pandoc()
 
-    dump = pypandoc.convert_file(str(in_file), 'plain', format='docx')
-    txt = parse_md(dump)
+def convert_batch(files, workers=None):
+    # files: [(in_file, out_file, fallback), ...]
+    # fallback: only convert when convert_native() left no out_file
+    # converts the files with pandoc, started once for all of them.
+    # yields out_file after each one is written, or False for the ones left to convert_native()
+    # and the ones pandoc failed on, in the order of files
+    todo = [not fallback or not out_file.is_file() for _, out_file, fallback in files]
+    dumps = pandoc_dumps([in_file for (in_file, _, _), do in zip(files, todo) if do], workers=workers)
+    for (in_file, out_file, _), do in zip(files, todo):
+        dump = next(dumps) if do else None
+        if dump is None:
+            yield False
+            continue
+        write_textonly(parse_md(dump), out_file)
+        yield out_file
+
+
+def write_textonly(txt, out_file):
+    count('lines', len(txt))
     # create new document
     style_content = {
         'name': 'ནང་དོན།',
@@ -56,13 +100,16 @@ def parse_md(string):
         else:
             txt = []
             for e in el:
-                e = e.replace('-', '').replace('[', '').replace(']', '').replace('|', '').replace('/', '').replace('“', '').replace('”', '').strip()
-                txt.append(e)
+                txt.append(clean_line(e))
             parsed_text.extend(txt)
 
     return parsed_text
 
 
+def clean_line(line):
+    return CLEANUP.sub('', line).strip()
+
+
 def parse_table(table):
     def get_sections(table):
         sections = []
@@ -96,22 +143,27 @@ def parse_table(table):
 
     sections = get_sections(table)
     txt = []
+    # the border lines of a table are mostly identical: only find the column boundaries once for each
+    boundaries = {}
     for section in sections:
         header, body = section[0], section[1:]
-        parts = parse_header(header)
+        if header not in boundaries:
+            boundaries[header] = parse_header(header)
+        parts = boundaries[header]
         # join column contents
         strings = defaultdict(list)
         for line in body:
             for n, idx in enumerate(parts):
                 start, end = idx
                 # extract and cleanup part
-                part = line[start:end].replace('-', '').replace('[', '').replace(']', '').replace('|', '').replace('/', '').replace('“', '').replace('”', '').strip()
+                part = clean_line(line[start:end])
                 # add it to strings
                 strings[n].append(part)
 
         # add to txt
         for string in strings.values():
             txt.append(''.join(string))
+    count('cells', len(txt))
     return txt
 
 
@@ -138,3 +190,99 @@ def separate_tables(string):
     if table:
         chunks.append(('table', table))
     return chunks
+
+
+def docx2lines(in_file):
+    # the lines parse_md() gives for the pandoc plain text dump of in_file, read from the docx without pandoc:
+    # paragraphs are wrapped the way pandoc does and separated by empty lines.
+    # returns None if the document contains something pandoc renders in ways not reproduced here
+    # (tables, lists, notes, content controls...). pandoc lays tables out as simple, multiline or grid tables
+    # depending on their content and its version, so they are always left to it
+    doc = Document(in_file)
+    # paragraph styles that make lists
+    list_styles = set()
+    for style in doc.styles.element.iterchildren(qn('w:style')):
+        if next(style.iter(qn('w:numPr')), None) is not None:
+            list_styles.add(style.get(qn('w:styleId')))
+
+    blocks = []
+    for el in doc.element.body.iterchildren():
+        if el.tag == qn('w:p'):
+            if not is_plain_par(el, list_styles):
+                return None
+            lines = par_lines(el)
+            if lines:
+                blocks.append(lines)
+        elif el.tag != qn('w:sectPr'):
+            return None
+
+    txt = []
+    for n, lines in enumerate(blocks):
+        if n:
+            txt.append('')
+        txt.extend(clean_line(line) for line in lines)
+    # pandoc ends its output with a newline
+    txt.append('')
+    return txt
+
+
+UNSUPPORTED = [qn(t) for t in ['w:numPr', 'w:footnoteReference', 'w:endnoteReference', 'w:sdt', 'w:txbxContent',
+                               'w:object', 'w:drawing', 'w:pict', 'm:oMath', 'm:oMathPara', 'w:vertAlign']]
+UNSUPPORTED.append('{http://schemas.openxmlformats.org/markup-compatibility/2006}AlternateContent')
+
+
+def is_plain_par(par, list_styles):
+    for tag in UNSUPPORTED:
+        if next(par.iter(tag), None) is not None:
+            return False
+    style = next(par.iter(qn('w:pStyle')), None)
+    return style is None or style.get(qn('w:val')) not in list_styles
+
+
+def par_text(par):
+    # text of the runs, line breaks as "\n". tabs and spaces are collapsed like pandoc does
+    text = []
+    for el in par.iter(qn('w:t'), qn('w:tab'), qn('w:br'), qn('w:cr')):
+        if el.tag == qn('w:t'):
+            text.append(el.text or '')
+        elif el.tag == qn('w:tab'):
+            # tab stops of the paragraph properties are not text
+            if el.getparent().tag == qn('w:r'):
+                text.append(' ')
+        else:
+            text.append('\n')
+    return [re.sub(r'[ \t\r]+', ' ', line).strip() for line in ''.join(text).split('\n')]
+
+
+def par_lines(par):
+    lines = []
+    for line in par_text(par):
+        if line:
+            lines.extend(wrap(line))
+    return lines
+
+
+def char_width(c):
+    # same as pandoc: combining characters take no room, wide east asian characters two columns
+    if unicodedata.combining(c) or unicodedata.category(c) in ('Mn', 'Me'):
+        return 0
+    if unicodedata.east_asian_width(c) in ('W', 'F'):
+        return 2
+    return 1
+
+
+def wrap(line, width=COLUMNS):
+    # greedy wrapping on spaces, words longer than width are not broken
+    lines = []
+    current, current_width = [], 0
+    for word in line.split(' '):
+        w = sum(char_width(c) for c in word)
+        if current and current_width + 1 + w > width:
+            lines.append(' '.join(current))
+            current, current_width = [], 0
+        current_width += w + 1 if current else w
+        current.append(word)
+    if current:
+        lines.append(' '.join(current))
+    return lines
+
@@ -1,17 +1,37 @@
+import hashlib
+import json
+import os
+import pickle
+import re
 from pathlib import Path
 
+import botok
 from botok import WordTokenizer, Config
+
+from .build_log import file_hash
+from .profiling import count
+from .segment_cache import SegmentationCache, dialect_digest
 #from spacy.lang.en import English
 #from spacy.lang.pt import Portuguese
 
+TOK_DATA = Path("../content/tok_data")
+REPLACEMENTS = TOK_DATA / "general" / "adjustments" / "rules" / "replacements.txt"
+SEGMENT_CACHE = TOK_DATA / "segmentation_cache.sqlite"
+TOK_SNAPSHOT = TOK_DATA / "general_tokenizer.snapshot"
+SNAPSHOT_VERSION = 1
+
 
 class Tokenizer:
-    def __init__(self, lang="bo"):
+    def __init__(self, lang="bo", cache=True):
+        self.lang = lang
         self.set_tok = None
         self.tokenize = None
+        self.rules = ReplacementRules(REPLACEMENTS)
+        self.cache = SegmentationCache(SEGMENT_CACHE, TOK_DATA / "general") if cache else None
         self.set_lang(lang)
 
     def set_lang(self, lang):
+        self.lang = lang
         if lang == "bo":
             self.set_tok = set_tok_bo
             self.tokenize = tokenize_bo
@@ -24,9 +44,162 @@ class Tokenizer:
 
     def tok_file(self, tok, in_file, out_file):
         dump = in_file.read_text()
-        out = self.tokenize(tok, dump)
+        out = self.tokenize(tok, dump, rules=self.rules, cache=self.cache)
         out_file.write_text(out)
 
+    def tok_file_stream(self, tok, in_file, out_file, chunk_size=500, resume=False):
+        # segments chunk_size lines at a time and appends them to a .part file as soon as they are ready.
+        # after each chunk, the input and output byte offsets are saved in a .progress file so that
+        # an interrupted run can be resumed with resume=True. the .progress file also identifies the input,
+        # so the .part is started again if the input changed in between.
+        # out_file only appears once complete, and is the same as with tok_file()
+        partial = out_file.parent / (out_file.name + ".part")
+        progress = out_file.parent / (out_file.name + ".progress")
+        st = in_file.stat()
+        source = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": file_hash(in_file)}
+        in_offset, out_offset = 0, 0
+        if resume and progress.is_file() and partial.is_file():
+            try:
+                saved = json.loads(progress.read_text())
+                if saved["input"] == source:
+                    in_offset, out_offset = saved["in"], saved["out"]
+            except (ValueError, KeyError, TypeError):
+                pass
+
+        with open(in_file, "rb") as f, open(partial, "ab") as out:
+            f.seek(in_offset)
+            out.truncate(out_offset)
+            out.seek(out_offset)
+
+            # same as splitting on "\n": a trailing newline is followed by an empty line
+            ends_with_newline = True
+            if in_offset:
+                f.seek(in_offset - 1)
+                ends_with_newline = f.read(1) in (b"\n", b"\r")
+
+            chunk = []
+            first = in_offset == 0
+            for raw in iter(f.readline, b""):
+                text = raw.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+                ends_with_newline = text.endswith("\n")
+                chunk.extend(text[:-1].split("\n") if ends_with_newline else text.split("\n"))
+                if len(chunk) >= chunk_size:
+                    out_offset = self._write_chunk(tok, chunk, out, out_offset, first)
+                    progress.write_text(json.dumps({"input": source, "in": f.tell(), "out": out_offset}))
+                    chunk = []
+                    first = False
+
+            if ends_with_newline:
+                chunk.append("")
+            if chunk:
+                self._write_chunk(tok, chunk, out, out_offset, first)
+
+        os.replace(partial, out_file)
+        if progress.is_file():
+            progress.unlink()
+
+    def _write_chunk(self, tok, lines, out, out_offset, first):
+        segmented = self.tokenize(tok, "\n".join(lines), rules=self.rules, cache=self.cache)
+        count("lines", len(lines))
+        count("tokens", len(segmented.split()))
+        if not first:
+            segmented = "\n" + segmented
+        segmented = segmented.encode("utf-8")
+        out.write(segmented)
+        out.flush()
+        return out_offset + len(segmented)
+
+
+# tokenizer of the current worker process, set by init_worker()
+_worker = None
+
+
+def init_worker(lang, cache=True):
+    global _worker
+    T = Tokenizer(lang=lang, cache=cache)
+    _worker = (T, T.set_tok())
+
+
+def segment_file(in_file, out_file):
+    # returns the cache hits and misses of this file
+    T, tok = _worker
+    hits, misses = (T.cache.hits, T.cache.misses) if T.cache else (0, 0)
+    T.tok_file_stream(tok, in_file, out_file, resume=True)
+    if T.cache:
+        hits, misses = T.cache.hits - hits, T.cache.misses - misses
+    return out_file, hits, misses
+
+
+class ReplacementRules:
+    # the "orig—repl" rules of replacements.txt, compiled once and reloaded only when the file changes.
+    # consecutive rules are grouped in passes applied with a single regex each. a rule starts a new pass
+    # when its pattern overlaps with the pattern or the replacement of a rule of the current pass,
+    # so the output is the same as applying each rule in turn with str.replace()
+    def __init__(self, path):
+        self.path = Path(path)
+        self.mtime = None
+        self.digest = None
+        self.passes = []
+
+    def refresh(self):
+        if not self.path.is_file():
+            self.path.write_text("")
+        mtime = self.path.stat().st_mtime_ns
+        if mtime != self.mtime:
+            dump = self.path.read_text()
+            self.passes = self.compile(self.parse(dump))
+            self.digest = hashlib.sha1(dump.encode("utf-8")).hexdigest()
+            self.mtime = mtime
+
+    @staticmethod
+    def parse(dump):
+        rules = []
+        for line in dump.split("\n"):
+            if "—" in line:
+                orig, repl = line.split("—")
+                rules.append((orig, repl))
+        return rules
+
+    @staticmethod
+    def compile(rules):
+        groups = []
+        group = []
+        for orig, repl in rules:
+            if any(overlaps(orig, o) or overlaps(orig, r) for o, r in group):
+                groups.append(group)
+                group = []
+            group.append((orig, repl))
+        if group:
+            groups.append(group)
+
+        passes = []
+        for group in groups:
+            if len(group) == 1:
+                passes.append((None, group[0]))
+            else:
+                regex = re.compile("|".join(re.escape(orig) for orig, _ in group))
+                passes.append((regex, dict(group)))
+        return passes
+
+    def apply(self, string):
+        for regex, rules in self.passes:
+            if regex is None:
+                orig, repl = rules
+                string = string.replace(orig, repl)
+            else:
+                string = regex.sub(lambda m: rules[m.group()], string)
+        return string
+
+
+def overlaps(a, b):
+    # True if an occurrence of a can share characters with an occurrence of b
+    if not a or not b or a in b or b in a:
+        return True
+    for i in range(1, min(len(a), len(b))):
+        if a.endswith(b[:i]) or b.endswith(a[:i]):
+            return True
+    return False
+
 
 #def set_tok_en():
     #nlp = English()
@@ -49,65 +222,99 @@ class Tokenizer:
 
 
 def set_tok_bo():
-    c = Config(dialect_name="general", base_path=Path("../content/tok_data"))
-    return WordTokenizer(config=c)
+    return load_tok_snapshot(TOK_SNAPSHOT, "general", TOK_DATA)
+
+
+def load_tok_snapshot(snapshot, dialect_name, base_path):
+    # the snapshot is a json header line followed by the pickled WordTokenizer.
+    # it is rebuilt whenever the header doesn't match the current dialect files and botok version
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "botok": getattr(botok, "__version__", ""),
+        "dialect": dialect_digest(base_path / dialect_name),
+    }
+    if snapshot.is_file():
+        with open(snapshot, "rb") as f:
+            try:
+                if json.loads(f.readline()) == header:
+                    return pickle.load(f)
+            except (ValueError, pickle.UnpicklingError, EOFError):
+                pass
+
+    print("\tbuilding the tokenizer...")
+    c = Config(dialect_name=dialect_name, base_path=base_path)
+    # build_trie: otherwise botok reloads its own <dialect>_trie.pickled, made from the dialect files as they were
+    tok = WordTokenizer(config=c, build_trie=True)
+
+    # write to a temporary file first so concurrent processes never read a partial snapshot
+    tmp = snapshot.parent / f"{snapshot.name}.{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write((json.dumps(header) + "\n").encode("utf-8"))
+        pickle.dump(tok, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, snapshot)
+    return tok
 
 
-def tokenize_bo(tok, string):
+def tokenize_bo(tok, string, rules=None, cache=None):
+    if not rules:
+        rules = ReplacementRules(REPLACEMENTS)
+    rules.refresh()
+
+    lines = string.split("\n")
+    # only lines that are not in the cache go through botok
+    cached = cache.get_many(lines, rules.digest) if cache else {}
+    new = {}
+    tokenized = []
+    for line in lines:
+        if line in cached:
+            tokenized.append(cached[line])
+        elif line in new:
+            tokenized.append(new[line])
+        else:
+            # do replacements
+            new[line] = rules.apply(tokenize_line_bo(tok, line))
+            tokenized.append(new[line])
+    if cache:
+        cache.put_many(new, rules.digest)
+
+    return "\n".join(tokenized)
+
+
+def tokenize_line_bo(tok, line):
     lemmatization_exceptions = ["བཅས་", "མཁས་"]
-    lines = []
-    for line in string.split("\n"):
-        tokens = tok.tokenize(line)
-        words = []
-        for t in tokens:
-            if t.chunk_type == "TEXT":
-                if not t.lemma:
-                    text = t.text
+    tokens = tok.tokenize(line)
+    words = []
+    for t in tokens:
+        if t.chunk_type == "TEXT":
+            if not t.lemma:
+                text = t.text
+            else:
+                if t.pos == "PART":
+                    if t.affix:
+                        text = "-" + t.text
+                    else:
+                        text = t.text
                 else:
-                    if t.pos == "PART":
-                        if t.affix:
-                            text = "-" + t.text
-                        else:
-                            text = t.text
+                    # Hack because of botok limitation:
+                    if (
+                        t.text_cleaned not in lemmatization_exceptions
+                        and t.affixation
+                        and "aa" in t.affixation
+                        and t.affixation["aa"]
+                    ):
+                        text = t.lemma
                     else:
-                        # Hack because of botok limitation:
-                        if (
-                            t.text_cleaned not in lemmatization_exceptions
-                            and t.affixation
-                            and "aa" in t.affixation
-                            and t.affixation["aa"]
-                        ):
-                            text = t.lemma
-                        else:
-                            text = t.text
-                text = text.strip().replace("༌", "་")
-                if not text.endswith("་"):
-                    text += "་"
-
-                if t.pos == "NON_WORD":
-                    text += "#"
-                words.append(text)
+                        text = t.text
+            text = text.strip().replace("༌", "་")
+            if not text.endswith("་"):
+                text += "་"
 
-            else:
-                t = t.text.replace(" ", "_")
-                words.append(t)
-
-        tokenized = " ".join(words)
-
-        # do replacements
-        repl_path = (
-            Path("../content/tok_data")
-            / "general"
-            / "adjustments"
-            / "rules"
-            / "replacements.txt"
-        )
-        if not repl_path.is_file():
-            repl_path.write_text("")
-        for Line in repl_path.read_text().split("\n"):
-            if "—" in Line:
-                orig, repl = Line.split("—")
-                tokenized = tokenized.replace(orig, repl)
-        lines.append(tokenized)
-
-    return "\n".join(lines)
\ No newline at end of file
+            if t.pos == "NON_WORD":
+                text += "#"
+            words.append(text)
+
+        else:
+            t = t.text.replace(" ", "_")
+            words.append(t)
+
+    return " ".join(words)
\ No newline at end of file
@@ -1,14 +1,20 @@
+import json
+import os
+from functools import partial
 from pathlib import Path
 
 import yaml
 
-from .corpus_segment import Tokenizer
+from .corpus_segment import Tokenizer, init_worker, segment_file
 from .google_drive import upload_to_drive, download_drive
 from .generate_to_tag import generate_to_tag
-from .convert2plaintxt import convert2plaintxt
+from .convert2plaintxt import convert_batch, convert_native, convert_pandoc
 from .extract_level_content import extract_content
 from .onto_from_tagged import onto_from_tagged
 from .merge_ontos import merge_ontos
+from .pipeline import Task, run_tasks
+from .build_log import BuildLog
+from .profiling import RunReport
 
 
 def create_pack(
@@ -21,7 +27,11 @@ def create_pack(
     l_colors=None,
     pos=None,
     levels=None,
-    legend=None
+    legend=None,
+    workers=None,
+    profile=None,
+    native=False,
+    dry_run=False
 ):
     if not subs:
         subs = [
@@ -43,10 +53,11 @@ def create_pack(
         return
 
     if mode == "local":
-        create_pack_local(path_ids, lang=lang, line_mode=line_mode, l_colors=l_colors, pos=pos, levels=levels, legend=legend, ontos=path_ontos)
+        create_pack_local(path_ids, lang=lang, line_mode=line_mode, l_colors=l_colors, pos=pos, levels=levels, legend=legend, ontos=path_ontos, workers=workers, profile=profile, native=native, dry_run=dry_run)
     elif mode == "drive":
-        create_pack_local(path_ids, lang=lang, line_mode=line_mode, l_colors=l_colors, pos=pos, levels=levels, legend=legend, ontos=path_ontos)
-        upload_to_drive(drive_ids)
+        create_pack_local(path_ids, lang=lang, line_mode=line_mode, l_colors=l_colors, pos=pos, levels=levels, legend=legend, ontos=path_ontos, workers=workers, profile=profile, native=native, dry_run=dry_run)
+        if not dry_run:
+            upload_to_drive(drive_ids)
     elif mode == "download":
         download_drive(path_ids)
     elif mode == "upload":
@@ -55,26 +66,99 @@ def create_pack(
         raise ValueError('either one of "local", "drive", "download" and "upload".')
 
 
-def create_pack_local(path_ids, lang="bo", line_mode="chunk", l_colors=None, pos=None, levels=None, legend=None, ontos=None):
-    state, resources = current_state(path_ids)
+def create_pack_local(path_ids, lang="bo", line_mode="chunk", l_colors=None, pos=None, levels=None, legend=None, ontos=None, workers=None, profile=None, native=False, dry_run=False):
+    # native: convert the raw docx files with docx2lines(), pandoc only converting the ones it can't handle
+    if not workers:
+        workers = {}
+    if not profile:
+        profile = {}
+    level = path_ids[0][0].parent
+    report = RunReport(level / profile['report'] if profile.get('report') else None, cprofile=profile.get('cprofile'))
+    with report.timer('state'):
+        state, resources = current_state(path_ids, save=not dry_run)
+    log = BuildLog(level / '.build_log.json')
     new_files = []
     T = Tokenizer(lang=lang)
-    tok = None
-    has_totag_unfinished = False
-    has_ontos_unfinished = False
+    tasks = []
+    serial = []  # the to-tag and onto steps depend on each other, so they run one after the other
+    unfinished = {'totag': False, 'ontos': False}
+
+    def create_totag(file, in_file, out_file):
+        if unfinished['totag']:
+            return False
+        print(f"\n{file}: creating the file to tag...")
+        tmp_onto = ontos[0] / (out_file.stem.split('_')[0] + '_partial.yaml')
+
+        finalized_ontos = ontos[0].parent
+        current_ontos = path_ids[5][0]
+        # generate partial ontos from the tagged chunks
+        if out_file.is_file():
+            onto_from_tagged(out_file, tmp_onto, finalized_ontos, current_ontos, ontos[0], legend)
+
+        # switch line_mode to chunk if filename ends with "vocab"
+        contextual_line_mode = ''
+        if file.endswith('vocab'):
+            contextual_line_mode += 'chunk'
+        else:
+            contextual_line_mode += line_mode
+
+        # create totag
+        unfinished['totag'] = generate_to_tag(in_file, out_file, finalized_ontos, current_ontos, pos, levels, contextual_line_mode, l_colors)
+
+        new_files.append(out_file)
+        # 8. manually POS tag the segmented text
+        print(
+            "\t--> Please manually tag new words with their POS tag and level. (words not tagged will be ignored)"
+        )
+
+    def create_onto(file, in_file, out_file):
+        if unfinished['ontos']:
+            return False
+
+        print(f"\t{file}: creating the onto from the tagged file...")
+        if out_file.is_file() and log.is_stale(out_file, [in_file]):
+            log.backup(out_file, always=True)
+            out_file.unlink()
+        if not out_file.is_file():
+            finalized_ontos = ontos[0].parent
+            current_ontos = path_ids[5][0]
+            onto_from_tagged(in_file, out_file, finalized_ontos, current_ontos, ontos[0].parent, legend)
+            new_files.append(out_file)
+
+        # removing temporary partial ontos
+        tmp_onto = out_file.parent / (out_file.stem.split('_')[0] + '_partial.yaml')
+        if tmp_onto.is_file():
+            tmp_onto.unlink()
+
+        # 6. manually fill in the onto
+        print(
+            '\t--> Please integrate new words in the onto from "to_organize" sections and add synonyms.'
+        )
+        unfinished['ontos'] = True
 
     for file, steps in state.items():
         print(file)
         cur = 1
         while cur <= 7 and cur in steps and steps[cur]:
             cur += 1
+        # restart from the first step whose output is older than its input
+        for step in range(2, cur):
+            if steps[step - 1] and log.is_stale(steps[step], [steps[step - 1]]):
+                print(f"\t{steps[step].name} is out of date")
+                cur = step
+                break
 
         # 1. convert raw .docx files to text only containing raw text
         if cur == 2:
-            print("\tconverting to simple text...")
+            print("\tqueued for conversion to simple text...")
             in_file = steps[cur-1]
             out_file = path_ids[cur-1][0] / (in_file.stem + '_textonly.docx')
-            convert2plaintxt(in_file, out_file)
+            if native:
+                first = Task(f'{file}: convert', 'convert', convert_native, (in_file, out_file), [in_file], [out_file])
+                tasks.append(first)
+                tasks.append(Task(f'{file}: pandoc', 'pandoc', convert_pandoc, (in_file, out_file, True), [in_file], [out_file], [first]))
+            else:
+                tasks.append(Task(f'{file}: pandoc', 'pandoc', convert_pandoc, (in_file, out_file, False), [in_file], [out_file]))
             new_files.append(out_file)
 
         # 2. mark all text to be extracted using a given style
@@ -83,21 +167,20 @@ def create_pack_local(path_ids, lang="bo", line_mode="chunk", l_colors=None, pos
         # 3. extract all marked text
         out_file = None
         if cur == 3:
-            print("\textracting all text and segmenting it")
+            print("\tqueued for extraction and segmentation...")
             in_file = steps[cur-1]
             out_file = path_ids[cur-1][0] / (in_file.stem.split('_')[0] + '_tosegment.txt')
-            extract_content(in_file, out_file)
+            tasks.append(Task(f'{file}: extract', 'extract', extract_content, (in_file, out_file), [in_file], [out_file]))
             new_files.append(out_file)
             cur += 1  # incrementing so that segmentation happens right after
 
         # 5. segment the selected input
         if cur == 4:
-            print("\tsegmenting...")
+            if not out_file:
+                print("\tqueued for segmentation...")
             in_file = steps[cur-1] if steps[cur-1] else out_file
             out_file = path_ids[cur - 1][0] / (in_file.stem.split('_')[0] + "_segmented.txt")
-            if not tok:
-                tok = T.set_tok()
-            T.tok_file(tok, in_file, out_file)
+            tasks.append(Task(f'{file}: segment', 'segment', segment_file, (in_file, out_file), [in_file], [out_file]))
             new_files.append(out_file)
 
         # 6. manually correct the segmentation
@@ -105,86 +188,146 @@ def create_pack_local(path_ids, lang="bo", line_mode="chunk", l_colors=None, pos
 
         # 7. create the _totag.xlsx in to_tag from the segmented .txt file from segmented
         if cur == 5:
-            if not has_totag_unfinished:
-                print("\ncreating the file to tag...")
-                in_file = steps[cur - 1]
-                out_file = path_ids[cur - 1][0] / (
-                    in_file.stem.split("_")[0] + "_totag.xlsx"
-                )
-                tmp_onto = ontos[0] / (out_file.stem.split('_')[0] + '_partial.yaml')
-
-                finalized_ontos = ontos[0].parent
-                current_ontos = path_ids[5][0]
-                # generate partial ontos from the tagged chunks
-                if out_file.is_file():
-                    onto_from_tagged(out_file, tmp_onto, finalized_ontos, current_ontos, ontos[0], legend)
-
-                # switch line_mode to chunk if filename ends with "vocab"
-                contextual_line_mode = ''
-                if file.endswith('vocab'):
-                    contextual_line_mode += 'chunk'
-                else:
-                    contextual_line_mode += line_mode
-
-                # create totag
-                has_totag_unfinished = generate_to_tag(in_file, out_file, finalized_ontos, current_ontos, pos, levels, contextual_line_mode, l_colors)
-
-                new_files.append(out_file)
-            # 8. manually POS tag the segmented text
-                print(
-                    "\t--> Please manually tag new words with their POS tag and level. (words not tagged will be ignored)"
-                )
+            in_file = steps[cur - 1]
+            out_file = path_ids[cur - 1][0] / (
+                in_file.stem.split("_")[0] + "_totag.xlsx"
+            )
+            serial.append(Task(f'{file}: to-tag', 'totag', create_totag, (file, in_file, out_file), [in_file], [out_file]))
 
         # 9. create .yaml ontology files from tagged .xlsx files from to_tag
         if cur == 6:
-            if has_ontos_unfinished:
-               continue
-
-            print("\t creating the onto from the tagged file...")
             in_file = steps[cur - 1]
             out_file = path_ids[cur - 1][0] / (
                 in_file.stem.split("_")[0] + "_onto.yaml"
             )
-            if not out_file.is_file():
-                finalized_ontos = ontos[0].parent
-                current_ontos = path_ids[5][0]
-                onto_from_tagged(in_file, out_file, finalized_ontos, current_ontos, ontos[0].parent, legend)
-                new_files.append(out_file)
-
-            # removing temporary partial ontos
-            tmp_onto = out_file.parent / (out_file.stem.split('_')[0] + '_partial.yaml')
-            if tmp_onto.is_file():
-                tmp_onto.unlink()
-
-            # 6. manually fill in the onto
-            print(
-                '\t--> Please integrate new words in the onto from "to_organize" sections and add synonyms.'
-            )
-            has_ontos_unfinished = True
+            serial.append(Task(f'{file}: onto', 'onto', create_onto, (file, in_file, out_file), [in_file], [out_file]))
+
+    for prev, t in zip(serial, serial[1:]):
+        t.after.append(prev)
+    tasks.extend(serial)
+
+    if dry_run:
+        report_dry_run(tasks, log, path_ids, ontos)
+        return
+
+    for t in tasks:
+        for out in t.outputs:
+            if out.is_file():
+                log.backup(out)
+        t.prof_file = report.prof_file(t.kind, t.name)
+
+    # run the independent steps concurrently, each kind of step with its own number of workers
+    if any(t.kind == 'segment' for t in tasks):
+        T.set_tok()  # make sure the tokenizer snapshot is up to date before the workers load it
+    sizes = pool_sizes(workers, ['convert', 'extract', 'segment'] if native else ['extract', 'segment'])
+    pools = {
+        'extract': (sizes['extract'], None, ()),
+        'segment': (sizes['segment'], init_worker, (lang, T.cache is not None)),
+    }
+    if native:
+        pools['convert'] = (sizes['convert'], None, ())
+    # the files left to pandoc are converted together, so pandoc is started once for all of them
+    batches = {'pandoc': partial(convert_batch, workers=workers.get('convert'))}
+    results = run_tasks(tasks, pools, batches)
+    report.add_tasks(tasks)
+    segmented = [results[t.name] for t in tasks if t.kind == 'segment']
+    if segmented and T.cache:
+        hits = sum(h for _, h, _ in segmented)
+        misses = sum(m for _, _, m in segmented)
+        print(f"\tsegmentation cache: {hits} hits, {misses} misses")
+    for t in tasks:
+        # the to-tag and onto steps return False when they were skipped,
+        # the conversions when done by the other one or when pandoc failed
+        if results[t.name] is False:
+            continue
+        for out in t.outputs:
+            if out.is_file():
+                log.record(out, t.inputs, t.kind, t.duration)
+    log.save()
 
     # 10. merge into the level onto
     # check that all the raw docx files have corresponding ontos
-    if sorted([p.stem for p in path_ids[0][0].glob('*.docx')]) == sorted([p.stem.split('_')[0] for p in path_ids[5][0].glob('*_onto.yaml')]):
-        in_path = path_ids[5][0]
-        out_file = in_path.parent / (in_path.stem + '_onto.yaml')
-        if not out_file.is_file():
+    level_onto = level_onto_inputs(path_ids)
+    if level_onto:
+        in_path, out_file, inputs = level_onto
+        if log.is_stale(out_file, inputs):
             print("\tmerging produced ontos into the level onto...")
-            merge_ontos(in_path, out_file)
+            # rebuilt from scratch, so that entries removed from the file ontos don't survive
+            log.backup(out_file, always=True)
+            with report.timer('merge', out_file.name):
+                merge_ontos(in_path, out_file, rebuild=True)
+            log.record(out_file, inputs)
             new_files.append(out_file)
 
     # 11. merge all level ontos into a single master onto
-    level_ontos = sorted([o for o in ontos[0].parent.glob('*.yaml') if not o.stem.startswith('master')])
-    master = ontos[0].parent / 'master_onto.yaml'
-    if not master.is_file():
+    level_ontos, master = master_onto_inputs(ontos)
+    if log.is_stale(master, level_ontos):
         print('\tcreating master onto...')
-        merge_ontos(level_ontos, master)
+        log.backup(master, always=True)
+        with report.timer('merge', master.name):
+            merge_ontos(level_ontos, master, rebuild=True)
+        log.record(master, level_ontos)
+    log.save()
+    report.save()
 
     write_to_upload(new_files)
 
 
-def current_state(paths_ids):
+def pool_sizes(workers, kinds):
+    # worker processes of each pool: the number set in config.yaml, the pools left empty sharing the other cores,
+    # so that the pools running side by side don't start more processes than there are cores
+    sizes = {kind: workers.get(kind) for kind in kinds}
+    unset = [kind for kind in kinds if not sizes[kind]]
+    if unset:
+        left = (os.cpu_count() or 1) - sum(n for n in sizes.values() if n)
+        for kind in unset:
+            sizes[kind] = max(1, left // len(unset))
+    return sizes
+
+
+def level_onto_inputs(path_ids):
+    # the level onto is only created once all the raw docx files have corresponding ontos
+    if sorted([p.stem for p in path_ids[0][0].glob('*.docx')]) != sorted([p.stem.split('_')[0] for p in path_ids[5][0].glob('*_onto.yaml')]):
+        return None
+    in_path = path_ids[5][0]
+    out_file = in_path.parent / (in_path.stem + '_onto.yaml')
+    return in_path, out_file, sorted(in_path.glob('*_onto.yaml'))
+
+
+def master_onto_inputs(ontos):
+    level_ontos = sorted([o for o in ontos[0].parent.glob('*.yaml') if not o.stem.startswith('master')])
+    master = ontos[0].parent / 'master_onto.yaml'
+    return level_ontos, master
+
+
+def report_dry_run(tasks, log, path_ids, ontos):
+    print('\nDry run: the following would be rebuilt')
+    total = 0
+    unknown = False
+    for t in tasks:
+        estimate = log.estimate(t.kind, t.inputs)
+        if estimate is None:
+            unknown = True
+            cost = 'no timing yet'
+        else:
+            total += estimate
+            cost = f'~{estimate:.1f}s'
+        print(f'\t{t.name} -> {", ".join(o.name for o in t.outputs)} ({cost})')
+
+    level_onto = level_onto_inputs(path_ids)
+    level_stale = level_onto and log.is_stale(level_onto[1], level_onto[2])
+    if level_stale:
+        print(f'\tlevel onto -> {level_onto[1].name}')
+    level_ontos, master = master_onto_inputs(ontos)
+    if level_stale or log.is_stale(master, level_ontos):
+        print(f'\tmaster onto -> {master.name}')
+
+    print(f'estimated time: ~{total:.1f}s' + (' (some steps have no timing yet)' if unknown else ''))
+
+
+def current_state(paths_ids, save=True):
+    # save: keep the folder scans in the state manifest for the next run
     state = {}
-    stems = []  # for ontos_path
 
     # workflow files
     file_type = {
@@ -196,9 +339,10 @@ def current_state(paths_ids):
         "ontos": ".yaml",
     }
     resources = {}
+    manifest = StateManifest(paths_ids[0][0].parent / '.state_manifest.json')
     for path, _ in paths_ids:
-        sorted_files = sorted(list(path.glob("*")))
-        for f in sorted_files:
+        for name in manifest.scan(path):
+            f = path / name
             if path.parts[-2] != 'ontos' and f.suffix != file_type[path.stem]:  # 5 first steps
                 continue
             elif path.parts[-2] == 'ontos' and f.suffix != file_type[path.parts[-2]]:  # 6th step
@@ -206,10 +350,8 @@ def current_state(paths_ids):
             # test chunks are all processed
             if path.stem.startswith('5'):
                 chunks_conf = f.parent / (f.stem.split('_')[0] + '.config')
-                if chunks_conf.is_file():
-                    config = yaml.safe_load(chunks_conf.read_text())
-                    if 'todo' in config.values():
-                        continue
+                if manifest.has_todo_chunks(chunks_conf):
+                    continue
 
             # ignore the partial ontos
             if path.parts[-2] == 'ontos':
@@ -218,8 +360,6 @@ def current_state(paths_ids):
 
             # add file to state
             stem = f.stem.split("_")[0]
-            if stem not in stems:
-                stems.append(stem)
             if stem not in state:
                 state[stem] = {i: None for i in range(1, len(paths_ids) + 1)}
             if path.parts[-2] != 'ontos':
@@ -230,9 +370,74 @@ def current_state(paths_ids):
 
             # add onto files to resources
 
+    if save:
+        manifest.save()
     return state, resources
 
 
+class StateManifest:
+    # keeps the content of the workflow folders between runs.
+    # a folder is only listed again when its mtime changed, and a chunks .config is only parsed again
+    # when its own mtime changed.
+    version = 2
+
+    def __init__(self, path):
+        self.path = path
+        self.changed = False
+        self.data = None
+        if path.is_file():
+            try:
+                self.data = json.loads(path.read_text())
+            except ValueError:
+                pass
+        if not self.data or self.data.get('version') != self.version:
+            self.data = {'version': self.version, 'folders': {}, 'configs': {}}
+            self.changed = True
+
+    def scan(self, folder):
+        # returns the sorted names of the files in folder
+        key = str(folder)
+        try:
+            mtime = folder.stat().st_mtime_ns
+        except FileNotFoundError:
+            return []
+
+        cached = self.data['folders'].get(key)
+        if cached and cached['mtime'] == mtime:
+            return cached['files']
+
+        with os.scandir(folder) as entries:
+            files = sorted(e.name for e in entries)
+        self.data['folders'][key] = {'mtime': mtime, 'files': files}
+        self.changed = True
+        return files
+
+    def has_todo_chunks(self, config_file):
+        key = str(config_file)
+        try:
+            mtime = config_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            if key in self.data['configs']:
+                del self.data['configs'][key]
+                self.changed = True
+            return False
+
+        cached = self.data['configs'].get(key)
+        if cached and cached['mtime'] == mtime:
+            return cached['todo']
+
+        config = yaml.safe_load(config_file.read_text())
+        todo = 'todo' in config.values()
+        self.data['configs'][key] = {'mtime': mtime, 'todo': todo}
+        self.changed = True
+        return todo
+
+    def save(self):
+        if self.changed:
+            self.path.write_text(json.dumps(self.data, ensure_ascii=False))
+            self.changed = False
+
+
 def write_to_upload(files):
     file = Path("to_upload.txt")
     if not file.is_file():
@@ -0,0 +1,40 @@
+class CumulativeVocab:
+    # the vocabulary of all the lessons seen so far, keyed on (path, word, sense).
+    # the first entry found for each key is kept, so a lesson is split in new, shared and absent words
+    # with dictionary lookups on the lesson's own entries instead of diffing two whole ontos
+    def __init__(self):
+        self.entries = {}  # (path, word, sense): (path, entry), in the order they were first seen
+
+    @staticmethod
+    def key(onto, path, entry):
+        return tuple(path), onto.get_field_value(entry, 'word'), onto.get_field_value(entry, 'sense')
+
+    def lesson_entries(self, onto):
+        # {key: (path, entry)} of a lesson onto
+        entries = {}
+        for path, e in onto.ont.find_entries():
+            for entry in e:
+                entries.setdefault(self.key(onto, path, entry), (path, entry))
+        return entries
+
+    def split(self, entries):
+        # entries: as given by lesson_entries()
+        # returns the same lists as OntoManager.diff_ontos():
+        # current only: [(path, entry), ...], common: [((path, current entry), (path, previous entry)), ...]
+        # and previous only: [(path, entry), ...]
+        current_only, common = [], []
+        for key, found in entries.items():
+            if key in self.entries:
+                common.append((found, self.entries[key]))
+            else:
+                current_only.append(found)
+        # the previous vocabulary is only walked to list the words that are not in the lesson
+        previous_only = [found for key, found in self.entries.items() if key not in entries]
+        return current_only, common, previous_only
+
+    def add(self, entries):
+        for key, found in entries.items():
+            self.entries.setdefault(key, found)
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,162 @@
+import zipfile
+from xml.sax.saxutils import escape
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>
+</Types>'''
+
+RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>'''
+
+DOCUMENT_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>'''
+
+DOCUMENT_START = f'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:document xmlns:w="{W_NS}"><w:body>'''
+
+DOCUMENT_END = '''<w:sectPr><w:pgSz w:w="12240" w:h="15840"/>\
+<w:pgMar w:top="1440" w:right="1800" w:bottom="1440" w:left="1800" w:header="720" w:footer="720" w:gutter="0"/>\
+</w:sectPr></w:body></w:document>'''
+
+# same look as the headings of python-docx's default template: (style id, name, size in pt, bold, italic, color)
+HEADINGS = [
+    ('Title', 'Title', 26, False, False, '17365D'),
+    ('Heading1', 'Heading 1', 14, True, False, '365F91'),
+    ('Heading2', 'Heading 2', 13, True, False, '4F81BD'),
+    ('Heading3', 'Heading 3', 11, True, False, '4F81BD'),
+    ('Heading4', 'Heading 4', 11, True, True, '4F81BD'),
+    ('Heading5', 'Heading 5', 11, False, False, '243F60'),
+    ('Heading6', 'Heading 6', 11, False, True, '243F60'),
+    ('Heading7', 'Heading 7', 11, False, True, '404040'),
+    ('Heading8', 'Heading 8', 10, False, False, '404040'),
+    ('Heading9', 'Heading 9', 10, False, True, '404040'),
+]
+
+
+def styles_xml(char_styles):
+    # char_styles: {name: {'font': str, 'size': pt, 'italic': bool}}, the style id being the name
+    parts = [f'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:styles xmlns:w="{W_NS}">
+<w:docDefaults><w:rPrDefault><w:rPr><w:sz w:val="24"/></w:rPr></w:rPrDefault></w:docDefaults>
+<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/></w:style>
+<w:style w:type="character" w:default="1" w:styleId="DefaultParagraphFont"><w:name w:val="Default Paragraph Font"/></w:style>''']
+    for style_id, name, size, bold, italic, color in HEADINGS:
+        r_pr = run_properties(size=size, bold=bold, italic=italic, color=color)
+        parts.append(f'<w:style w:type="paragraph" w:styleId="{style_id}"><w:name w:val="{name}"/>'
+                     f'<w:basedOn w:val="Normal"/><w:next w:val="Normal"/>'
+                     f'<w:pPr><w:keepNext/><w:spacing w:before="200" w:after="0"/></w:pPr>{r_pr}</w:style>')
+    for name, spec in char_styles.items():
+        r_pr = run_properties(font=spec.get('font'), size=spec.get('size'), italic=spec.get('italic'))
+        parts.append(f'<w:style w:type="character" w:customStyle="1" w:styleId="{escape(name)}">'
+                     f'<w:name w:val="{escape(name)}"/><w:basedOn w:val="DefaultParagraphFont"/>{r_pr}</w:style>')
+    parts.append('</w:styles>')
+    return '\n'.join(parts)
+
+
+def run_properties(style=None, font=None, size=None, bold=None, italic=None, color=None):
+    props = []
+    if style:
+        props.append(f'<w:rStyle w:val="{escape(style)}"/>')
+    if font:
+        font = escape(font, {'"': '&quot;'})
+        props.append(f'<w:rFonts w:ascii="{font}" w:hAnsi="{font}" w:cs="{font}"/>')
+    if bold:
+        props.append('<w:b/>')
+    if italic:
+        props.append('<w:i/>')
+    if color:
+        props.append(f'<w:color w:val="{color}"/>')
+    if size:
+        props.append(f'<w:sz w:val="{int(size * 2)}"/><w:szCs w:val="{int(size * 2)}"/>')
+    return f'<w:rPr>{"".join(props)}</w:rPr>' if props else ''
+
+
+def run_xml(text, style=None, color=None):
+    # like python-docx, "\n" becomes a line break and "\t" a tab
+    content = []
+    for n, line in enumerate(text.split('\n')):
+        if n:
+            content.append('<w:br/>')
+        for m, part in enumerate(line.split('\t')):
+            if m:
+                content.append('<w:tab/>')
+            if part:
+                content.append(f'<w:t xml:space="preserve">{escape(part)}</w:t>')
+    return f'<w:r>{run_properties(style=style, color=color)}{"".join(content)}</w:r>'
+
+
+def heading_xml(text, level, color=None):
+    style_id = 'Title' if level == 0 else f'Heading{level}'
+    return f'<w:p><w:pPr><w:pStyle w:val="{style_id}"/></w:pPr>{run_xml(text, color=color)}</w:p>'
+
+
+def paragraph_xml(runs):
+    # runs: [(text, style, color), ...]
+    return f'<w:p>{"".join(run_xml(text, style, color) for text, style, color in runs)}</w:p>'
+
+
+def blocks_xml(blocks):
+    # blocks: ('heading', text, level, color) and ('paragraph', runs) tuples
+    xml = []
+    for block in blocks:
+        if block[0] == 'heading':
+            xml.append(heading_xml(*block[1:]))
+        else:
+            xml.append(paragraph_xml(block[1]))
+    return ''.join(xml)
+
+
+class DocxStreamWriter:
+    # writes a .docx by streaming the WordprocessingML of its body to the zip file,
+    # instead of building the whole document in memory with python-docx
+    def __init__(self, path, char_styles, buffer_size=2**16):
+        self.zip = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED)
+        self.zip.writestr('[Content_Types].xml', CONTENT_TYPES)
+        self.zip.writestr('_rels/.rels', RELS)
+        self.zip.writestr('word/_rels/document.xml.rels', DOCUMENT_RELS)
+        self.zip.writestr('word/styles.xml', styles_xml(char_styles))
+        self.stream = self.zip.open('word/document.xml', 'w', force_zip64=True)
+        self.buffer = []
+        self.buffered = 0
+        self.buffer_size = buffer_size
+        self.write(DOCUMENT_START)
+
+    def write(self, xml):
+        # xml: body content, like the output of blocks_xml()
+        self.buffer.append(xml)
+        self.buffered += len(xml)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.stream.write(''.join(self.buffer).encode('utf-8'))
+        self.buffer = []
+        self.buffered = 0
+
+    def heading(self, text, level, color=None):
+        self.write(heading_xml(text, level, color))
+
+    def paragraph(self, runs):
+        self.write(paragraph_xml(runs))
+
+    def close(self):
+        self.write(DOCUMENT_END)
+        self.flush()
+        self.stream.close()
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
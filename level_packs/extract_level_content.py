@@ -1,12 +1,117 @@
+import posixpath
+import zipfile
+
 import docx
+from lxml import etree
+
+from .profiling import count
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+REL = '{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'
+ON = ('1', 'true', 'on')
+# text equivalent of the run content, as python-docx gives it in Run.text
+RUN_TEXT = {W + 'tab': '\t', W + 'ptab': '\t', W + 'cr': '\n', W + 'noBreakHyphen': '-'}
 
 
-def extract_content(in_file, out_file):
+def extract_content(in_file, out_file, streaming=True):
+    # streaming reads document.xml paragraph by paragraph instead of loading the whole document with python-docx
     style_to_extract = 'ནང་དོན།'
+    if streaming:
+        content = list(stream_styled_runs(in_file, style_to_extract))
+        count('lines', len(content))
+        out_file.write_text('\n'.join(content))
+        return
+
     doc = docx.Document(in_file)
     content = []
     for par in doc.paragraphs:
         for run in par.runs:
             if run.style.name == style_to_extract:
                 content.append(run.text)
+    count('lines', len(content))
     out_file.write_text('\n'.join(content))
+
+
+def stream_styled_runs(in_file, style_name):
+    # yields the text of the runs of the body paragraphs having style_name as character style.
+    # same runs as python-docx's Document.paragraphs and Paragraph.runs: tables, hyperlinks... are left out.
+    # each paragraph is discarded once read, so memory doesn't grow with the document
+    with zipfile.ZipFile(in_file) as z:
+        document = rel_target(z, '', 'officeDocument')
+        styles = rel_target(z, document, 'styles')
+        matches = style_matcher(z, styles, style_name)
+
+        with z.open(document) as f:
+            body = None
+            for event, el in etree.iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    if el.tag == W + 'body':
+                        body = el
+                    continue
+                if body is None or el.getparent() is not body:
+                    continue
+
+                if el.tag == W + 'p':
+                    for r in el.iterchildren(W + 'r'):
+                        r_style = r.find(f'{W}rPr/{W}rStyle')
+                        if matches(r_style.get(W + 'val') if r_style is not None else None):
+                            yield run_text(r)
+                # done with this body element and the ones before it
+                el.clear()
+                while el.getprevious() is not None:
+                    del body[0]
+
+
+def rel_target(z, source, rel_type):
+    # path in the zip of the part related to source (a part path, '' for the package) by rel_type
+    folder, name = posixpath.split(source)
+    rels = posixpath.join(folder, '_rels', name + '.rels')
+    for rel in etree.fromstring(z.read(rels)).iter(REL):
+        if rel.get('Type').endswith('/' + rel_type):
+            target = rel.get('Target')
+            if target.startswith('/'):
+                return target[1:]
+            return posixpath.normpath(posixpath.join(folder, target))
+    return None
+
+
+def style_matcher(z, styles, style_name):
+    # resolves the character style of a run from its style id once for all the ids, the way python-docx does:
+    # runs without style, or with an id that is not a character style, have the default character style
+    ids = {}
+    default = None
+    if styles:
+        for style in etree.fromstring(z.read(styles)).iterchildren(W + 'style'):
+            type_ = style.get(W + 'type', 'paragraph')
+            name = style.find(W + 'name')
+            name = name.get(W + 'val') if name is not None else None
+            style_id = style.get(W + 'styleId')
+            if style_id not in ids:
+                ids[style_id] = (type_, name)
+            if type_ == 'character' and style.get(W + 'default') in ON:
+                default = name
+
+    matching = {i for i, (type_, name) in ids.items() if type_ == 'character' and name == style_name}
+    default_matches = default is not None and default == style_name
+
+    def matches(style_id):
+        if style_id in matching:
+            return True
+        if style_id is None or style_id not in ids or ids[style_id][0] != 'character':
+            return default_matches
+        return False
+
+    return matches
+
+
+def run_text(r):
+    text = []
+    for el in r.iterchildren():
+        if el.tag == W + 't':
+            text.append(el.text or '')
+        elif el.tag == W + 'br':
+            if el.get(W + 'type', 'textWrapping') == 'textWrapping':
+                text.append('\n')
+        elif el.tag in RUN_TEXT:
+            text.append(RUN_TEXT[el.tag])
+    return ''.join(text)
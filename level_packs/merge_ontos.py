@@ -1,12 +1,15 @@
 from .onto.leavedonto import OntoManager
+from .profiling import count_entries
 
 
-def merge_ontos(ontos_path, out_file):
-    if out_file.is_file():
+def merge_ontos(ontos_path, out_file, rebuild=False):
+    # rebuild: start from an empty onto instead of merging into the existing out_file
+    if out_file.is_file() and not rebuild:
         om = OntoManager(out_file)
     else:
         om = OntoManager()
         om.onto1.ont_path = out_file
 
     om.batch_merge_to_onto(ontos_path)
+    count_entries(om.onto1)
     om.onto1.convert2yaml()
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import pickle
+import sys
+from pathlib import Path
+
+from .onto.leavedonto import OntoManager
+
+CACHE_VERSION = 2
+CACHE_NAME = '.merged_onto.cache'
+
+# pickled merged ontos of this run, by key
+_merged = {}
+# digest of the leavedonto code, see code_stamp()
+_code = None
+
+
+def merge_finalized_ontos(finalized_ontos, current_ontos):
+    # returns an OntoManager with the ontos of the finalized levels and the current ontos merged.
+    # the partial ontos the to-tag step writes in current_ontos right before merging are left out of the cached merge
+    # and merged on top of it, so regenerating them doesn't invalidate it
+    partials = sorted(current_ontos.glob('*_partial.yaml'))
+    om = merge_base_ontos(finalized_ontos, current_ontos, partials)
+    for partial in partials:
+        om.merge_to_onto(partial)
+    return om
+
+
+def merge_base_ontos(finalized_ontos, current_ontos, partials):
+    # the result is cached in memory and on disk, keyed on the paths, mtimes and sizes of all the input ontos,
+    # so it is only merged again when one of them changes. every call gets its own copy
+    folders = sorted([f for f in finalized_ontos.glob('*') if f.is_dir() and f.parts[-1] != current_ontos.parts[-1]])
+    # if a level onto is created, use it instead
+    level_ontos = []
+    for n, f in enumerate(folders):
+        l_onto = f.parent / (f.stem + '_onto.yaml')
+        if l_onto.is_file():
+            folders[n] = None  # remove onto path without shortening list
+            level_ontos.append(l_onto)
+    current = [f for f in sorted(current_ontos.glob('*.yaml')) if f not in partials]
+
+    inputs = []
+    for folder in [f for f in folders if f]:
+        inputs.extend(sorted(folder.glob('*.yaml')))
+    inputs.extend(current)
+    inputs.extend(level_ontos)
+    key = inputs_key(inputs)
+
+    if key in _merged:
+        return pickle.loads(_merged[key])
+
+    cache_file = finalized_ontos / CACHE_NAME
+    dump = read_cache(cache_file, key)
+    if dump:
+        try:
+            om = pickle.loads(dump)
+        except Exception:  # truncated file, classes that changed or moved...: merged again below
+            om = None
+        if om is not None:
+            _merged[key] = dump
+            return om
+
+    om = OntoManager()
+    # merge finalized ontos
+    for folder in folders:
+        if folder:
+            om.batch_merge_to_onto(ontos=folder)
+    for onto in level_ontos:
+        om.merge_to_onto(onto)
+
+    # merge current ontos
+    if current:
+        om.batch_merge_to_onto(ontos=current)
+
+    try:
+        dump = pickle.dumps(om, protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return om
+    _merged[key] = dump
+    write_cache(cache_file, key, dump)
+    return om
+
+
+def inputs_key(inputs):
+    h = hashlib.sha1()
+    for f in inputs:
+        st = f.stat()
+        h.update(f'{f}\t{st.st_mtime_ns}\t{st.st_size}\n'.encode('utf-8'))
+    return h.hexdigest()
+
+
+def code_stamp():
+    # the pickled OntoManager is only valid with the leavedonto classes it was made with
+    global _code
+    if _code is None:
+        h = hashlib.sha1()
+        package = Path(sys.modules[OntoManager.__module__].__file__).parent
+        for f in sorted(package.rglob('*.py')):
+            h.update(f.read_bytes())
+        _code = h.hexdigest()
+    return _code
+
+
+def read_cache(cache_file, key):
+    if not cache_file.is_file():
+        return None
+    with open(cache_file, 'rb') as f:
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            return None
+        if header != {'version': CACHE_VERSION, 'code': code_stamp(), 'key': key}:
+            return None
+        return f.read()
+
+
+def write_cache(cache_file, key, dump):
+    tmp = cache_file.parent / f'{cache_file.name}.{os.getpid()}'
+    with open(tmp, 'wb') as f:
+        f.write((json.dumps({'version': CACHE_VERSION, 'code': code_stamp(), 'key': key}) + '\n').encode('utf-8'))
+        f.write(dump)
+    os.replace(tmp, cache_file)
@@ -0,0 +1,69 @@
+from collections import defaultdict
+
+from .origins import OriginTable
+
+
+class OntoIndex:
+    # dictionary lookups over the entries of a LeavedOnto.
+    # every entry gets a row id, indexed by word and by the value of the legend fields given in "fields".
+    # the POS, category and parsed origins of each row are also kept in columns for batched queries.
+    # the index is built once, for the onto as it is when the index is made
+    def __init__(self, onto, fields=('level',)):
+        self.onto = onto
+        self.fields = [f for f in fields if f in onto.ont.legend]
+        self.rows = {}  # row id: (path, entry)
+        self.by_word = defaultdict(list)
+        self.by_field = {f: defaultdict(set) for f in self.fields}
+        self.pos_col = {}  # row id: POS
+        self.cat_col = {}  # row id: category path
+        self.origins = OriginTable()
+        self.origin_col = {}  # row id: entry id in self.origins
+        for path, entries in onto.ont.find_entries():
+            for entry in entries:
+                self._add_row(path, entry)
+
+    def _add_row(self, path, entry):
+        row = len(self.rows)
+        self.rows[row] = (path, entry)
+        self.by_word[self.onto.get_field_value(entry, 'word')].append(row)
+        for f in self.fields:
+            self.by_field[f][self.onto.get_field_value(entry, f)].add(row)
+        self.pos_col[row] = path[0]
+        self.cat_col[row] = '/'.join(path)
+        self.origin_col[row] = self.origins.add(self.onto.get_field_value(entry, 'origin'))
+
+    def find_rows(self, queries):
+        # batched lookups: queries is a list of (word, pos, cat, fields) and the result a list of row ids for each,
+        # in onto order. resolved as one join for the whole batch: the rows of the distinct words are gathered
+        # in a single pass over by_word and grouped by POS, category and the values of the queried fields,
+        # then each distinct query intersects the groups it asks for
+        candidates = set()
+        for word in {q[0] for q in queries}:
+            candidates.update(self.by_word.get(word, ()))
+        unindexed = {f for q in queries if q[3] for f in q[3] if f not in self.by_field}
+        by_pos, by_cat, by_value = defaultdict(set), defaultdict(set), defaultdict(set)
+        for row in candidates:
+            by_pos[self.pos_col[row]].add(row)
+            by_cat[self.cat_col[row]].add(row)
+            for f in unindexed:
+                by_value[f, self.onto.get_field_value(self.rows[row][1], f)].add(row)
+
+        resolved = {}
+        results = []
+        for word, pos, cat, fields in queries:
+            key = (word, pos, cat, tuple(fields.items()) if fields else None)
+            if key not in resolved:
+                rows = self.by_word.get(word, [])
+                keep = set(rows)
+                if pos:
+                    keep &= by_pos.get(pos, set())
+                if cat:
+                    keep &= by_cat.get(cat, set())
+                for field, value in (fields or {}).items():
+                    if field in self.by_field:
+                        keep &= self.by_field[field].get(value, set())
+                    else:
+                        keep &= by_value.get((field, value), set())
+                resolved[key] = [r for r in rows if r in keep]
+            results.append(resolved[key])
+        return results
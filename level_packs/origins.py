@@ -0,0 +1,68 @@
+from array import array
+from bisect import bisect_left
+
+
+class OriginTable:
+    # the "file:freq — file:freq" origin fields of onto entries, parsed once into integer-coded arrays.
+    # files and lessons (the part of the filename before "-") are interned. lessons are ranked in string order,
+    # so comparing ranks is the same as comparing lesson names.
+    # entries are only ever added: a table belongs to one OntoIndex, built once for the ontos of a run
+    def __init__(self):
+        self.files = []  # file id: filename
+        self.file_ids = {}
+        self.file_lesson = array('I')  # file id: lesson id
+        self.lessons = []  # lesson id: lesson
+        self.lesson_ids = {}
+        self.starts = array('I', [0])  # the origins of entry n are at starts[n]:starts[n + 1]
+        self.origin_files = array('I')
+        self.freqs = array('I')
+        self._ranks = None
+        self._sorted = None
+
+    def add(self, origin):
+        # returns the id of the new entry
+        if origin:
+            for o in str(origin).split(' — '):
+                if ':' not in o:
+                    continue
+                filename, freq = o.rsplit(':', 1)
+                self.origin_files.append(self._file_id(filename))
+                self.freqs.append(int(freq))
+        self.starts.append(len(self.freqs))
+        return len(self.starts) - 2
+
+    def _file_id(self, filename):
+        if filename not in self.file_ids:
+            lesson = filename.split('-')[0]
+            if lesson not in self.lesson_ids:
+                self.lesson_ids[lesson] = len(self.lessons)
+                self.lessons.append(lesson)
+                self._ranks = None
+            self.file_ids[filename] = len(self.files)
+            self.files.append(filename)
+            self.file_lesson.append(self.lesson_ids[lesson])
+        return self.file_ids[filename]
+
+    def _rank_lessons(self):
+        if self._ranks is None:
+            order = sorted(range(len(self.lessons)), key=self.lessons.__getitem__)
+            self._ranks = array('I', [0] * len(order))
+            for rank, lesson_id in enumerate(order):
+                self._ranks[lesson_id] = rank
+            self._sorted = [self.lessons[i] for i in order]
+
+    def rank(self, lesson):
+        # rank of any lesson name, known or not: ranks of the known lessons below it are smaller
+        self._rank_lessons()
+        return bisect_left(self._sorted, lesson)
+
+    def records(self, entry):
+        # [(filename, lesson, lesson rank, freq), ...]
+        self._rank_lessons()
+        start, end = self.starts[entry], self.starts[entry + 1]
+        records = []
+        for file_id, freq in zip(self.origin_files[start:end], self.freqs[start:end]):
+            lesson_id = self.file_lesson[file_id]
+            records.append((self.files[file_id], self.lessons[lesson_id], self._ranks[lesson_id], freq))
+        return records
+
@@ -0,0 +1,148 @@
+import base64
+import http.client
+import json
+import socket
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pypandoc
+
+
+def ensure_pandoc():
+    # download pandoc if missing
+    try:
+        pypandoc.get_pandoc_path()
+    except OSError:
+        print('pandoc is not installed. Installing pandoc...')
+        pypandoc.download_pandoc()
+
+
+def convert_docx(in_file):
+    return pypandoc.convert_file(str(in_file), 'plain', format='docx')
+
+
+class PandocServer:
+    # a "pandoc server" process (pandoc 3+) converting documents sent over http,
+    # so pandoc is started once for all the files instead of once per file
+    def __init__(self, startup_timeout=10, timeout=600):
+        self.proc = None
+        self.url = None
+        self.startup_timeout = startup_timeout
+        self.timeout = timeout  # seconds to wait for the conversion of a batch
+
+    def start(self):
+        # returns False if the server can't be used
+        try:
+            if int(pypandoc.get_pandoc_version().split('.')[0]) < 3:
+                return False
+        except (OSError, ValueError):
+            return False
+
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}'
+        self.proc = subprocess.Popen(
+            [pypandoc.get_pandoc_path(), 'server', '--port', str(port), '--timeout', '300'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                break
+            try:
+                with urllib.request.urlopen(self.url + '/version', timeout=1):
+                    return True
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.05)
+        self.stop()
+        return False
+
+    def convert(self, files):
+        # one request for all the files, the outputs come back in the same order
+        params = [
+            {'text': base64.b64encode(f.read_bytes()).decode('ascii'), 'from': 'docx', 'to': 'plain'}
+            for f in files
+        ]
+        request = urllib.request.Request(
+            self.url + '/batch', data=json.dumps(params).encode('utf-8'),
+            headers={'Content-Type': 'application/json', 'Accept': 'application/json'},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            results = json.loads(response.read().decode('utf-8'))
+
+        dumps = []
+        for f, result in zip(files, results):
+            if isinstance(result, dict):
+                if 'error' in result:
+                    raise ValueError(f'pandoc could not convert {f.name}: {result["error"]}')
+                output = result['output']
+                if result.get('base64'):
+                    output = base64.b64decode(output).decode('utf-8')
+                dumps.append(output)
+            else:
+                dumps.append(result)
+        return dumps
+
+    def running(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def stop(self):
+        if self.proc:
+            self.proc.terminate()
+            self.proc.wait()
+            self.proc = None
+
+
+def pandoc_dumps(files, workers=None, batch_size=25, server=True):
+    # yields the plain text conversion of each file, in order, or None for the files pandoc can't convert.
+    # the files are sent to a pandoc server by batches, or converted by one pandoc process per file
+    # in a pool of "workers" threads if the installed pandoc has no server mode.
+    # the files of a batch the server fails on are converted one by one, so one bad file doesn't stop the others
+    files = list(files)
+    if not files:
+        return
+    ensure_pandoc()
+
+    srv = PandocServer()
+    if server and len(files) > 1 and srv.start():
+        try:
+            for i in range(0, len(files), batch_size):
+                batch = files[i:i + batch_size]
+                dumps = None
+                if srv.running():
+                    try:
+                        dumps = srv.convert(batch)
+                    except (OSError, ValueError, http.client.HTTPException) as e:  # including timeouts
+                        print(f'\tthe pandoc server failed on {batch[0].name}...{batch[-1].name} ({e}), '
+                              'converting these files one by one')
+                if dumps is None:
+                    yield from convert_files(batch, workers)
+                else:
+                    yield from dumps
+        finally:
+            srv.stop()
+        return
+
+    yield from convert_files(files, workers)
+
+
+def convert_files(files, workers=None):
+    if workers == 1 or len(files) == 1:
+        for f in files:
+            yield try_convert_docx(f)
+    else:
+        # pandoc does the work in its own process, so threads are enough
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            yield from pool.map(try_convert_docx, files)
+
+
+def try_convert_docx(in_file):
+    try:
+        return convert_docx(in_file)
+    except (RuntimeError, OSError) as e:
+        print(f'\tpandoc could not convert {in_file.name}: {e}')
+        return None
@@ -0,0 +1,122 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from .profiling import take_counts, profile_to, reset_peak_rss, task_peak_rss
+
+
+class Task:
+    # a unit of work of the pipeline.
+    # a task is ready when the tasks producing its inputs and the tasks in "after" are done.
+    # tasks whose kind has a worker pool run in it, the others run in the main process in the order given
+    def __init__(self, name, kind, func, args=(), inputs=(), outputs=(), after=()):
+        self.name = name
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.after = list(after)
+        self.deps = set()
+        self.duration = None
+        self.counts = None  # items processed, see profiling.count()
+        self.peak_rss = None  # while the task ran, in MB, see profiling.task_peak_rss()
+        self.prof_file = None  # if set, the task is run under cProfile and its stats saved there
+
+    def __repr__(self):
+        return f'Task({self.name!r}, {self.kind!r})'
+
+
+def resolve_deps(tasks):
+    producers = {}
+    for t in tasks:
+        for out in t.outputs:
+            producers[out] = t
+
+    for t in tasks:
+        t.deps = set(t.after)
+        for i in t.inputs:
+            if i in producers and producers[i] is not t:
+                t.deps.add(producers[i])
+
+
+def timed(func, args, prof_file=None):
+    # returns (result, seconds, counts, peak rss)
+    take_counts()
+    reset = reset_peak_rss()
+    start = time.perf_counter()
+    with profile_to(prof_file):
+        result = func(*args)
+    return result, time.perf_counter() - start, take_counts(), task_peak_rss(reset)
+
+
+def run_tasks(tasks, pools=None, batches=None):
+    # pools: {kind: (max_workers, initializer, initargs)}
+    # batches: {kind: func}, func being given the args of all the ready tasks of that kind at once
+    # and yielding the result of each task in turn. batches run in the main process
+    # returns {task name: result}
+    if not pools:
+        pools = {}
+    if not batches:
+        batches = {}
+    resolve_deps(tasks)
+
+    executors = {}
+    results = {}
+    done = set()
+    pending = list(tasks)
+    running = {}
+    try:
+        while pending or running:
+            ready = [t for t in pending if t.deps <= done]
+            for t in ready:
+                pending.remove(t)
+                if t.kind not in pools or t.kind in batches:
+                    continue
+                if t.kind not in executors:
+                    max_workers, initializer, initargs = pools[t.kind]
+                    executors[t.kind] = ProcessPoolExecutor(
+                        max_workers=max_workers, initializer=initializer, initargs=initargs
+                    )
+                running[executors[t.kind].submit(timed, t.func, t.args, t.prof_file)] = t
+
+            # tasks running in the main process, one at a time while the pools keep working
+            inline = [t for t in ready if t.kind not in pools or t.kind in batches]
+            if inline and inline[0].kind in batches:
+                kind = inline[0].kind
+                batch = [t for t in inline if t.kind == kind]
+                pending = [t for t in inline if t.kind != kind] + pending
+                take_counts()
+                reset = reset_peak_rss()
+                start = time.perf_counter()
+                # the batch is profiled as a whole, in the file of its first task
+                with profile_to(batch[0].prof_file):
+                    for t, result in zip(batch, batches[kind]([t.args for t in batch])):
+                        results[t.name] = result
+                        t.duration = time.perf_counter() - start
+                        t.counts, t.peak_rss = take_counts(), task_peak_rss(reset)
+                        reset = reset_peak_rss()
+                        start = time.perf_counter()
+                        done.add(t)
+                continue
+            if inline:
+                t = inline[0]
+                pending = inline[1:] + pending
+                results[t.name], t.duration, t.counts, t.peak_rss = timed(t.func, t.args, t.prof_file)
+                done.add(t)
+                continue
+
+            if not running:
+                if pending:
+                    raise ValueError(f'circular dependencies between {pending}')
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                t = running.pop(future)
+                results[t.name], t.duration, t.counts, t.peak_rss = future.result()
+                done.add(t)
+    finally:
+        for executor in executors.values():
+            executor.shutdown(cancel_futures=True)
+
+    return results
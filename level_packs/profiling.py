@@ -0,0 +1,162 @@
+import cProfile
+import csv
+import json
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# items processed by the current process since the last take_counts(): lines, tokens, cells, onto entries...
+_counts = Counter()
+# whether a RunReport with a file is collecting, for the counts that are costly to make
+_collecting = False
+
+
+def count(name, n=1):
+    _counts[name] += n
+
+
+def take_counts():
+    counts = dict(_counts)
+    _counts.clear()
+    return counts
+
+
+def reset_peak_rss():
+    # starts the peak resident memory of this process over (linux only), for peak_rss(since_reset=True).
+    # returns False where it can't be done
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss(children=False, since_reset=False):
+    # peak resident memory in MB of this process since it started, or of its terminated child processes.
+    # since_reset: of this process since the last reset_peak_rss()
+    if since_reset:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+        return None
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on linux, in bytes on macOS
+    size = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return round(size / 2**20, 1)
+
+
+@contextmanager
+def profile_to(prof_file):
+    # runs the block under cProfile and saves the stats in prof_file. does nothing if prof_file is None
+    if not prof_file:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(str(prof_file))
+
+
+def task_peak_rss(reset):
+    # peak memory of what ran since reset_peak_rss() returned reset. None where it can't be measured:
+    # the peak of the whole process would include the tasks it ran before
+    return peak_rss(since_reset=True) if reset else None
+
+
+def count_entries(onto):
+    # walks the whole onto, so only done when a run report is written
+    if _collecting:
+        count('onto entries', sum(len(entries) for _, entries in onto.ont.find_entries()))
+
+
+class RunReport:
+    # timings, item counts and peak memory of each step of a run, per file.
+    # saved as json (a summary per step followed by the records) or as csv (the records) depending on the suffix of path.
+    # the steps of the kind given in cprofile are run under cProfile, their stats saved next to the report
+    def __init__(self, path=None, cprofile=None):
+        global _collecting
+        _collecting = path is not None
+        self.path = path
+        self.cprofile = cprofile
+        self.records = []
+        self.start = time.perf_counter()
+
+    def prof_file(self, step, name):
+        if not self.path or step != self.cprofile:
+            return None
+        name = re.sub(r'[^\w.-]+', '_', name)
+        return self.path.parent / f'{step}-{name}.prof'
+
+    def add(self, step, name, seconds, counts=None, rss=None):
+        record = {'step': step, 'file': name, 'seconds': round(seconds, 4), 'peak_rss_mb': rss}
+        record.update(counts or {})
+        self.records.append(record)
+
+    def add_tasks(self, tasks):
+        # tasks run by pipeline.run_tasks()
+        for t in tasks:
+            if t.duration is not None:
+                self.add(t.kind, t.name, t.duration, t.counts, t.peak_rss)
+
+    @contextmanager
+    def timer(self, step, name=''):
+        # for the steps running in this process
+        take_counts()
+        reset = reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            with profile_to(self.prof_file(step, name)):
+                yield
+        finally:
+            self.add(step, name, time.perf_counter() - start, take_counts(), task_peak_rss(reset))
+
+    def summary(self):
+        steps = {}
+        for record in self.records:
+            step = steps.setdefault(record['step'], {'files': 0, 'seconds': 0, 'peak_rss_mb': None})
+            step['files'] += 1
+            step['seconds'] = round(step['seconds'] + record['seconds'], 4)
+            if record['peak_rss_mb'] is not None:
+                step['peak_rss_mb'] = max(step['peak_rss_mb'] or 0, record['peak_rss_mb'])
+            for k, v in record.items():
+                if k not in ('step', 'file', 'seconds', 'peak_rss_mb'):
+                    step[k] = step.get(k, 0) + v
+        return steps
+
+    def save(self):
+        if not self.path or not self.records:
+            return
+        if self.path.suffix == '.csv':
+            fields = ['step', 'file', 'seconds', 'peak_rss_mb']
+            for record in self.records:
+                fields.extend(k for k in record if k not in fields)
+            with open(self.path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=fields)
+                writer.writeheader()
+                writer.writerows(self.records)
+        else:
+            # the peaks of the processes are reset before each step where possible, the highest step peak is then
+            # the peak of the run. otherwise it is the peak of the processes since they started
+            peaks = [r['peak_rss_mb'] for r in self.records if r['peak_rss_mb'] is not None]
+            report = {
+                'seconds': round(time.perf_counter() - self.start, 4),
+                'peak_rss_mb': max(peaks) if peaks else max(peak_rss() or 0, peak_rss(children=True) or 0) or None,
+                'steps': self.summary(),
+                'files': self.records,
+            }
+            self.path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f'\trun report written to {self.path}')
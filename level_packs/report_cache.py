@@ -0,0 +1,102 @@
+import gzip
+import hashlib
+import pickle
+
+from .build_log import file_hash
+
+
+def files_digest(files):
+    h = hashlib.sha1()
+    for f in files:
+        h.update(f'{f.name}\t{file_hash(f)}\n'.encode('utf-8'))
+    return h.hexdigest()
+
+
+def lesson_digest(lesson):
+    # lesson: {'legend': (...), 'words': [(word, pos, field), ...]} as given by parse_vocab()
+    return hashlib.sha1(repr((lesson['legend'], lesson['words'])).encode('utf-8')).hexdigest()
+
+
+def lesson_sheets(lesson_data):
+    # titles of the tagged sheets the sentences of a lesson are taken from
+    sheets = set()
+    for occurences in lesson_data.values():
+        for k, v in occurences.get('occurences', {}).items():
+            if k != 'freq':
+                sheets.update(f['origin'] for f in v['files'] if 'sentences' in f['origin'])
+    return sheets
+
+
+class ReportCache:
+    # the data of the words report, stored per lesson in a gzipped pickle.
+    # a lesson is computed again when the ontos change, when its rows in the vocab workbook change
+    # or when one of the tagged sheets it takes sentences from changes
+    schema = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+        if path.is_file():
+            try:
+                with gzip.open(path, 'rb') as f:
+                    self.data = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+        if not self.data or self.data.get('schema') != self.schema:
+            self.data = {'schema': self.schema, 'onto': None, 'tagged': {}, 'sheets': {}, 'lessons': {}}
+
+    def changed_files(self, tagged_digests):
+        # names of the workbooks that are new, changed or removed since the cache was saved
+        return sorted(name for name in set(tagged_digests) | set(self.data['tagged'])
+                      if tagged_digests.get(name) != self.data['tagged'].get(name))
+
+    def stale_lessons(self, vocab, onto_digest, changed_files, sheets):
+        # returns the (level, lesson) pairs to compute again.
+        # sheets: {workbook name: [title, ...]} of the changed workbooks, as parsed now.
+        # a changed sheet is one these workbooks had before or have now, so new workbooks count too
+        changed_sheets = set()
+        for name in changed_files:
+            changed_sheets.update(self.data['sheets'].get(name, []))
+            changed_sheets.update(sheets.get(name, []))
+
+        stale = set()
+        for level, lessons in vocab.items():
+            for lesson, a in lessons.items():
+                cached = self.data['lessons'].get((level, lesson))
+                if not cached \
+                        or self.data['onto'] != onto_digest \
+                        or cached['vocab'] != lesson_digest(a) \
+                        or cached['sheets'] & changed_sheets:
+                    stale.add((level, lesson))
+        return stale
+
+    def update(self, vocab, word_data, onto_digest, tagged_digests, sheets):
+        # sheets: {workbook name: [title, ...]} of the workbooks that were parsed again
+        self.data['onto'] = onto_digest
+        self.data['tagged'] = dict(tagged_digests)
+        for name in list(self.data['sheets']):
+            if name not in tagged_digests:
+                del self.data['sheets'][name]
+        self.data['sheets'].update(sheets)
+        for level, lessons in word_data.items():
+            for lesson, lesson_data in lessons.items():
+                self.data['lessons'][(level, lesson)] = {
+                    'vocab': lesson_digest(vocab[level][lesson]),
+                    'sheets': lesson_sheets(lesson_data),
+                    'data': lesson_data,
+                }
+        # forget the lessons that are not in the vocab anymore
+        current = {(level, lesson) for level, lessons in vocab.items() for lesson in lessons}
+        for key in [k for k in self.data['lessons'] if k not in current]:
+            del self.data['lessons'][key]
+
+    def lesson(self, level, lesson):
+        return self.data['lessons'][(level, lesson)]['data']
+
+    def sheet_files(self, titles):
+        # names of the workbooks containing the given sheets
+        return [name for name, sheets in self.data['sheets'].items() if set(sheets) & titles]
+
+    def save(self):
+        with gzip.open(self.path, 'wb') as f:
+            pickle.dump(self.data, f, protocol=pickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,119 @@
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+
+import botok
+
+# part of the keys: to bump when the segmentation done around botok changes (tokenize_line_bo() in corpus_segment.py)
+CACHE_VERSION = 1
+
+
+def dialect_digest(dialect_path):
+    # hash of the content of all the files of a tok_data dialect, ignoring botok's own pickled tries
+    h = hashlib.sha1()
+    for f in sorted(p for p in Path(dialect_path).rglob("*") if p.is_file() and p.suffix != ".pickled"):
+        h.update(str(f.relative_to(dialect_path)).encode("utf-8"))
+        h.update(f.read_bytes())
+    return h.hexdigest()
+
+
+class SegmentationCache:
+    # on-disk cache of segmented lines. a line is found under the hash of its content, of the dialect used by botok,
+    # of the botok version, of CACHE_VERSION and of the replacement rules applied after segmentation.
+    # the least recently used lines are evicted when the cache grows over max_size bytes.
+    # the size of the cache is only checked after evict_every bytes were added by this process,
+    # as summing it means reading the whole table
+    def __init__(self, path, dialect_path, max_size=256 * 2**20, evict_every=16 * 2**20):
+        self.path = Path(path)
+        self.dialect_path = Path(dialect_path)
+        self.max_size = max_size
+        self.evict_every = evict_every
+        self.added = 0  # bytes added since the last check
+        self.hits = 0
+        self.misses = 0
+        self._dialect = None
+        self._db = None
+
+    @property
+    def db(self):
+        if not self._db:
+            self._db = sqlite3.connect(str(self.path), timeout=60)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS segments "
+                "(key TEXT PRIMARY KEY, value TEXT, size INTEGER, used INTEGER)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS segments_used ON segments (used)")
+        return self._db
+
+    @property
+    def dialect(self):
+        if not self._dialect:
+            self._dialect = dialect_digest(self.dialect_path)
+        return self._dialect
+
+    def key(self, line, rules_digest):
+        h = hashlib.sha1(line.encode("utf-8")).hexdigest()
+        return f"{h}:{self.dialect}:{getattr(botok, '__version__', '')}:{CACHE_VERSION}:{rules_digest}"
+
+    def get_many(self, lines, rules_digest):
+        keys = {self.key(line, rules_digest): line for line in set(lines)}
+        found = {}
+        batch = list(keys)
+        for i in range(0, len(batch), 500):
+            part = batch[i:i + 500]
+            rows = self.db.execute(
+                f"SELECT key, value FROM segments WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            for key, value in rows:
+                found[keys[key]] = value
+
+        if found:
+            now = time.time_ns()
+            self.db.executemany(
+                "UPDATE segments SET used = ? WHERE key = ?",
+                [(now, self.key(line, rules_digest)) for line in found],
+            )
+            self.db.commit()
+
+        for line in lines:
+            if line in found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def put_many(self, segmented, rules_digest):
+        # segmented: {line: segmented line}
+        if not segmented:
+            return
+
+        now = time.time_ns()
+        rows = [
+            (self.key(line, rules_digest), value, len(line.encode("utf-8")) + len(value.encode("utf-8")), now)
+            for line, value in segmented.items()
+        ]
+        self.db.executemany("INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?)", rows)
+        self.added += sum(row[2] for row in rows)
+        if self.added >= self.evict_every:
+            self.evict()
+            self.added = 0
+        self.db.commit()
+
+    def evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM segments").fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        to_delete = []
+        for key, size in self.db.execute("SELECT key, size FROM segments ORDER BY used"):
+            to_delete.append((key,))
+            total -= size
+            if total <= self.max_size:
+                break
+        self.db.executemany("DELETE FROM segments WHERE key = ?", to_delete)
+
+    def close(self):
+        if self._db:
+            self._db.close()
+            self._db = None
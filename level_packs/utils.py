@@ -1,53 +1,201 @@
+from array import array
 from collections import defaultdict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 from openpyxl import load_workbook
 
 
 def parse_vocab(filepath):
-    wb = load_workbook(Path(filepath))
+    # streams the rows of each sheet: only columns with a header are kept and they are read in triples
+    wb = load_workbook(Path(filepath), read_only=True)
     total = {}
     for sheet in wb.worksheets:
-        cols = [[cell.value for cell in col] for col in sheet.columns if col[0].value]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            continue
+        cols = [n for n, value in enumerate(header) if value]
         # sanity check
         if len(cols) % 3:
             exit(ValueError('the number of columns should be a multiple of 3'))
 
+        groups = [cols[i:i + 3] for i in range(0, len(cols), 3)]
+        words = [[] for _ in groups]
+        for row in rows:
+            for g, idx in enumerate(groups):
+                a, b, c = [row[i] if i < len(row) else None for i in idx]
+                if a:
+                    words[g].append((a, b, c))
+
         triples = {}
-        for i in range(0, len(cols), 3):
-            current = None
-            legend = None
-            tr = []
-            for j in range(len(cols[i])):
-                a, b, c = cols[i][j], cols[i + 1][j], cols[i + 2][j]
-                if j == 0:
-                    legend = (a, b, c)
-                    current = a
-                elif a:
-                    tr.append((a, b, c))
+        for idx, tr in zip(groups, words):
+            legend = tuple(header[i] for i in idx)
             if tr:
-                triples[current] = {'legend': legend, 'words': tr}
+                triples[legend[0]] = {'legend': legend, 'words': tr}
         if triples:
             total[sheet.title] = triples
 
+    wb.close()
     return total
 
 
-def parse_tagged_sentences(tagged_path):
-    parsed = {}
-    for f in tagged_path.glob('*.xlsx'):
-        wb = load_workbook(f)
-        for sheet in wb.worksheets:
-            title = sheet.title
-            if not 'sentences' in title:
-                continue
-            if title not in parsed:
-                parsed[title] = defaultdict(int)
-
-            rows = [[cell.value for cell in row] for row in sheet.rows]
-            for i in range(0, len(rows), 4):
-                words = [r for r in rows[i] if r]
-                pos = [r for r in rows[i+1] if r]
+def parse_tagged_sentences(tagged_path, files=None, workers=None, parsed=None):
+    # files: only parse these workbooks instead of all the ones in tagged_path
+    # parsed: a Concordance the sentences are added to, instead of a new one
+    # workbooks are parsed in parallel, the results are merged in the order of the files
+    if files is None:
+        files = sorted(tagged_path.glob('*.xlsx'))
+    files = list(files)
+
+    if workers == 1 or len(files) < 2:
+        results = [parse_tagged_workbook(f) for f in files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(parse_tagged_workbook, files))
+
+    if parsed is None:
+        parsed = Concordance()
+    for name, sheets in results:
+        parsed.files[name] = []
+        for title, sentences in sheets:
+            parsed.add_sheet(title)
+            parsed.files[name].append(title)
+            for pairs, count in sentences:
+                parsed.add(title, pairs, count)
+    return parsed
+
+
+def parse_tagged_workbook(f):
+    # returns (workbook name, [(title, [(sentence, count), ...]), ...])
+    wb = load_workbook(f, read_only=True)
+    sheets = []
+    for sheet in wb.worksheets:
+        title = sheet.title
+        if not 'sentences' in title:
+            continue
+
+        # sentences come in groups of 4 rows: words, POS and two other rows
+        counts = defaultdict(int)
+        words = []
+        for i, row in enumerate(sheet.iter_rows(values_only=True)):
+            if i % 4 == 0:
+                words = [r for r in row if r]
+            elif i % 4 == 1:
+                pos = [r for r in row if r]
                 pairs = tuple(zip(words, pos))
-                parsed[title][pairs] += 1
-    return parsed
\ No newline at end of file
+                counts[pairs] += 1
+        sheets.append((title, list(counts.items())))
+    wb.close()
+    return f.name, sheets
+
+
+class Concordance(dict):
+    # {sheet title: TaggedSentences}, all the sheets sharing the same table of interned words and POS tags
+    def __init__(self):
+        super().__init__()
+        self.interner = Interner()
+        self.files = {}  # workbook name: [title, ...]
+
+    def add_sheet(self, title):
+        if title not in self:
+            self[title] = TaggedSentences(self.interner)
+
+    def add(self, title, sentence, count=1):
+        self.add_sheet(title)
+        self[title].add(sentence, count)
+
+    def find(self, pair, title=None):
+        # sentences containing the (word, POS) pair, in the given sheet or in all of them
+        titles = [title] if title else list(self)
+        found = []
+        for t in titles:
+            if t in self:
+                found.extend(self[t].find(pair))
+        return found
+
+    def count(self, title, sentence):
+        return self[title].get(sentence, 0) if title in self else 0
+
+
+class Interner:
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+
+    def add(self, value):
+        if value not in self.ids:
+            self.ids[value] = len(self.values)
+            self.values.append(value)
+        return self.ids[value]
+
+    def get(self, value):
+        return self.ids.get(value)
+
+
+class TaggedSentences(Mapping):
+    # {sentence: count} where a sentence is a tuple of (word, POS) pairs, stored as arrays of interned ids.
+    # sentences are numbered in order of appearance and indexed by the pairs they contain
+    def __init__(self, interner):
+        self.interner = interner
+        self.tokens = array('I')  # word and POS ids of all the sentences, interleaved
+        self.starts = array('I', [0])  # sentence n is tokens[starts[n]:starts[n + 1]]
+        self.counts = array('I')
+        self.ids = {}  # encoded sentence: sentence id
+        self.index = {}  # (word id, POS id) packed in an int: array of sentence ids
+
+    def encode(self, sentence, add=False):
+        # returns None if a word or a tag was never seen
+        encoded = array('I')
+        for pair in sentence:
+            for value in pair:
+                i = self.interner.add(value) if add else self.interner.get(value)
+                if i is None:
+                    return None
+                encoded.append(i)
+        return encoded
+
+    def add(self, sentence, count=1):
+        encoded = self.encode(sentence, add=True)
+        key = encoded.tobytes()
+        if key not in self.ids:
+            sent_id = len(self.counts)
+            self.ids[key] = sent_id
+            self.tokens.extend(encoded)
+            self.starts.append(len(self.tokens))
+            self.counts.append(0)
+            for n in range(0, len(encoded), 2):
+                pair = encoded[n] << 32 | encoded[n + 1]
+                if pair not in self.index:
+                    self.index[pair] = array('I')
+                ids = self.index[pair]
+                if not ids or ids[-1] != sent_id:
+                    ids.append(sent_id)
+        self.counts[self.ids[key]] += count
+
+    def decode(self, sent_id):
+        values = self.interner.values
+        encoded = self.tokens[self.starts[sent_id]:self.starts[sent_id + 1]]
+        return tuple((values[encoded[n]], values[encoded[n + 1]]) for n in range(0, len(encoded), 2))
+
+    def find(self, pair):
+        # sentences containing the (word, POS) pair, in order of appearance
+        encoded = self.encode([pair])
+        if encoded is None:
+            return []
+        ids = self.index.get(encoded[0] << 32 | encoded[1], [])
+        return [self.decode(i) for i in ids]
+
+    def __getitem__(self, sentence):
+        encoded = self.encode(sentence)
+        if encoded is None or encoded.tobytes() not in self.ids:
+            raise KeyError(sentence)
+        return self.counts[self.ids[encoded.tobytes()]]
+
+    def __iter__(self):
+        for sent_id in range(len(self.counts)):
+            yield self.decode(sent_id)
+
+    def __len__(self):
+        return len(self.counts)
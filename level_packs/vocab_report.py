@@ -1,11 +1,17 @@
 from collections import defaultdict
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
 from docx import Document
 from docx.shared import Pt, RGBColor
 from docx.enum.style import WD_STYLE_TYPE
 
 from .onto.leavedonto import OntoManager, LeavedOnto
+from .cumulative_vocab import CumulativeVocab
+from .docx_stream import DocxStreamWriter, blocks_xml
+from .onto_index import OntoIndex
+from .profiling import RunReport, count
+from .build_log import file_hash
+from .report_cache import ReportCache, files_digest, lesson_sheets
 from .utils import parse_vocab, parse_tagged_sentences
 
 new = 'New Words'
@@ -17,6 +23,12 @@ absent = 'Not in Current'
 total_word_count = 'Total Word Count: {}'
 vocab = 'Vocabulary'
 FIELDS = ['word', 'origin']
+RED = 'FF0000'
+WORDS_REPORT_STYLES = {
+    'freq': {'font': 'Lato', 'italic': True, 'size': 7},
+    'entry': {'font': 'Lato Light', 'size': 7},
+    'tree': {'font': 'Lato Light', 'size': 5},
+}
 
 
 def get_selected_fields(om, entry):
@@ -28,31 +40,32 @@ def get_selected_fields(om, entry):
     return filtered
 
 
-def gen_vocab_report(onto_path, out_path, vocab_path, tagged_path):
-    # total_data = gather_total_data(onto_path)
-    # lessons_data = gather_lesson_data(onto_path)
-
-    import pickle
-    tmp = Path('tmp.pickle')
-    if not tmp.is_file():
-        words_data = gather_word_data(onto_path, vocab_path, tagged_path)
-        pickle.dump(words_data, open(str(tmp), 'wb'))
-    else:
-        words_data = pickle.load(open(str(tmp), 'rb'))
-
+def gen_vocab_report(onto_path, out_path, vocab_path, tagged_path, workers=None, per_lesson=False, report_file=None):
+    # per_lesson: one Words Report per lesson instead of a single one for the level
+    # report_file: .json or .csv file where the timings of each stage are written
+    report = RunReport(report_file)
+    level = onto_path.stem
 
+    # total_data = gather_total_data(onto_path)
+    with report.timer('gather lessons', level):
+        lessons_data = gather_lesson_data(onto_path)
 
-    level = onto_path.stem
+    cache_file = out_path / f'.{level} Words Report.cache'
+    with report.timer('gather words', level):
+        words_data = gather_word_data(onto_path, vocab_path, tagged_path, cache_file=cache_file, workers=workers)
 
-    # # format it in docx
+    # format it in docx
     # total_file = out_path / f'{level} Vocab Report - Total.docx'
     # export_total_vocab_report(level, total_data, total_file)
-    #
-    # lessons_file = out_path / f'{level} Vocab Report - Lessons.docx'
-    # export_lessons_vocab_report(level, lessons_data, lessons_file)
+
+    lessons_file = out_path / f'{level} Vocab Report - Lessons.docx'
+    with report.timer('export lessons', lessons_file.name):
+        export_lessons_vocab_report(level, lessons_data, lessons_file)
 
     words_file = out_path / f'{level} Words Report.docx'
-    export_words_report(words_data, words_file)
+    with report.timer('export words', words_file.name):
+        export_words_report(words_data, words_file, workers=workers, per_lesson=per_lesson)
+    report.save()
 
 
 def export_lessons_vocab_report(level, total_data, out_file):
@@ -168,94 +181,159 @@ def export_total_vocab_report(level, total_data, out_file):
     doc.save(out_file)
 
 
-def export_words_report(words_data, words_file):
+def export_words_report(words_data, words_file, streaming=True, workers=None, per_lesson=False):
+    # streaming writes the document xml straight to the .docx, python-docx builds it in memory first.
+    # per_lesson: one document per lesson next to words_file instead of a single document.
+    # when streaming, the lessons are rendered in parallel unless workers is 1
+    count('words', sum(len(words) for lessons in words_data.values() for words in lessons.values()))
+    if not streaming:
+        if per_lesson:
+            for level, lessons in words_data.items():
+                for lesson, words in lessons.items():
+                    blocks = [('heading', f'Level {level}', 1, None), *lesson_blocks(lesson, words)]
+                    save_docx(blocks, lesson_file(words_file, level, lesson))
+        else:
+            save_docx(words_report_blocks(words_data), words_file)
+        return
+
+    # lesson sections come back in order, whatever the number of workers
+    sections = render_lessons(words_data, workers)
+    if per_lesson:
+        for level, lessons in words_data.items():
+            for lesson in lessons:
+                with DocxStreamWriter(lesson_file(words_file, level, lesson), WORDS_REPORT_STYLES) as doc:
+                    doc.heading(f'Level {level}', 1)
+                    doc.write(next(sections))
+    else:
+        with DocxStreamWriter(words_file, WORDS_REPORT_STYLES) as doc:
+            for level, lessons in words_data.items():
+                # TITLE
+                doc.heading(f'Level {level}', 1)
+                for _ in lessons:
+                    doc.write(next(sections))
+
+
+def lesson_file(words_file, level, lesson):
+    return words_file.parent / f'{words_file.stem} - {level} Lesson {lesson}{words_file.suffix}'
+
+
+def render_lessons(words_data, workers=None):
+    # yields the xml body of each lesson section, in the order of words_data
+    lessons = [(lesson, words) for lessons in words_data.values() for lesson, words in lessons.items()]
+    if workers == 1 or len(lessons) < 2:
+        for lesson, words in lessons:
+            yield render_lesson(lesson, words)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from pool.map(render_lesson, *zip(*lessons))
+
+
+def render_lesson(lesson, words):
+    return blocks_xml(lesson_blocks(lesson, words))
+
+
+def save_docx(blocks, out_file):
     doc = Document()
     styles = doc.styles
+    for name, spec in WORDS_REPORT_STYLES.items():
+        style = styles.add_style(name, WD_STYLE_TYPE.CHARACTER)
+        style.font.name = spec['font']
+        style.font.size = Pt(spec['size'])
+        if spec.get('italic'):
+            style.font.italic = True
+
+    for block in blocks:
+        if block[0] == 'heading':
+            _, text, level, color = block
+            heading = doc.add_heading(text, level)
+            if color:
+                heading.runs[-1].font.color.rgb = RGBColor.from_string(color)
+        else:
+            par = doc.add_paragraph()
+            for text, style, color in block[1]:
+                run = par.add_run(text, style=style)
+                if color:
+                    run.font.color.rgb = RGBColor.from_string(color)
 
-    freq_style = styles.add_style('freq', WD_STYLE_TYPE.CHARACTER)
-    freq_font = freq_style.font
-    freq_font.name = 'Lato'
-    freq_font.italic = True
-    freq_font.size = Pt(7)
-
-    entry_style = styles.add_style('entry', WD_STYLE_TYPE.CHARACTER)
-    entry_font = entry_style.font
-    entry_font.size = Pt(7)
-    entry_font.name = 'Lato Light'
+    doc.save(out_file)
 
-    tree_style = styles.add_style('tree', WD_STYLE_TYPE.CHARACTER)
-    tree_font = tree_style.font
-    tree_font.name = 'Lato Light'
-    tree_font.size = Pt(5)
 
+def words_report_blocks(words_data):
+    # the Words Report as a sequence of ('heading', text, level, color) and ('paragraph', runs) blocks,
+    # runs being [text, style, color] lists
     for level, lessons in words_data.items():
         # TITLE
-        doc.add_heading(f'Level {level}', 1)
+        yield 'heading', f'Level {level}', 1, None
 
         for lesson, words in lessons.items():
-            doc.add_heading(f'Lesson {lesson}', 3)
+            yield from lesson_blocks(lesson, words)
 
-            for word, occurences in words.items():
-                word_heading = doc.add_heading(f'"{word}"', 5)
-                sanity_freq = 0
-
-                onto_par = doc.add_paragraph()
-                onto_path = ''
-
-                if 'sanity' in occurences:
-                    sanity = occurences['sanity']
-                    heading = doc.add_heading('Previous lessons', 7)
-                    run = heading.runs[-1]
-                    run.font.color.rgb = RGBColor(255, 0, 0)
-                    for f in sanity:
-                        sanity_freq += f['freq']
-                        par = doc.add_paragraph()
-                        run = par.add_run(f'{f["origin"]}.docx, freq: {f["freq"]}, path: {"/".join(f["path"])}', style=freq_style)
-                        run.font.color.rgb = RGBColor(255, 0, 0)
-                        if 'sentences' in f:
-                            for sent in f['sentences']:
-                                par.add_run('\n')
-                                run = par.add_run(' '.join([s[0] for s in sent]), style=entry_style)
-                                run.font.color.rgb = RGBColor(255, 0, 0)
-
-                if not 'occurences' in occurences:
-                    continue
-
-                occurences = occurences['occurences']
-                total_freq = occurences['freq'] + sanity_freq
-                word_heading.add_run(f': {total_freq}')
-
-                lessons_with_word = [o for o in occurences.keys() if o  != 'freq']
-                for l_ww in lessons_with_word:
-                    lesson_freq = occurences[l_ww]['freq']
-                    doc.add_heading(f'{l_ww}: {lesson_freq}', 7)
 
-                    par = doc.add_paragraph()
+def lesson_blocks(lesson, words):
+    yield 'heading', f'Lesson {lesson}', 3, None
+
+    for word, occurences in words.items():
+        yield from word_blocks(word, occurences)
+
+
+def word_blocks(word, occurences):
+    # the heading and the first paragraph are only complete once all the occurences are seen
+    word_heading = ['heading', f'"{word}"', 5, None]
+    sanity_freq = 0
+
+    onto_runs = []
+    onto_path = ''
+    blocks = [word_heading, ('paragraph', onto_runs)]
+
+    if 'sanity' in occurences:
+        sanity = occurences['sanity']
+        blocks.append(('heading', 'Previous lessons', 7, RED))
+        for f in sanity:
+            sanity_freq += f['freq']
+            runs = [[f'{f["origin"]}.docx, freq: {f["freq"]}, path: {"/".join(f["path"])}', 'freq', RED]]
+            if 'sentences' in f:
+                for sent in f['sentences']:
+                    runs.append(['\n', None, None])
+                    runs.append([' '.join([s[0] for s in sent]), 'entry', RED])
+            blocks.append(('paragraph', runs))
+
+    if not 'occurences' in occurences:
+        return blocks
+
+    occurences = occurences['occurences']
+    total_freq = occurences['freq'] + sanity_freq
+    word_heading[1] += f': {total_freq}'
 
-                    for f_ww in occurences[l_ww]['files']:
+    lessons_with_word = [o for o in occurences.keys() if o  != 'freq']
+    for l_ww in lessons_with_word:
+        lesson_freq = occurences[l_ww]['freq']
+        blocks.append(('heading', f'{l_ww}: {lesson_freq}', 7, None))
 
-                        file_freq = f_ww['freq']
-                        par.add_run(f'{file_freq} in ', style=freq_style)
+        runs = []
+        for f_ww in occurences[l_ww]['files']:
 
-                        f = f_ww['origin']
-                        par.add_run(f'"{f}.docx"', style=freq_style)
+            file_freq = f_ww['freq']
+            runs.append([f'{file_freq} in ', 'freq', None])
 
-                        path = '/'.join(f_ww['path'])
-                        if not onto_path:
-                            onto_path = path
-                            onto_par.add_run(f'onto: {path}', style=freq_style)
-                        elif path != onto_path:
-                            par.add_run(f', onto: {path}', style=freq_style)
+            f = f_ww['origin']
+            runs.append([f'"{f}.docx"', 'freq', None])
 
-                        if 'sentences' in f_ww:
-                            par.add_run('\n\t')
-                            for sent in f_ww['sentences']:
-                                par.add_run('{'+ ' '.join([s[0] for s in sent]) + '}, ', style=entry_style)
-                            par.runs[-1].text = par.runs[-1].text.rstrip().rstrip(',')
-                        par.add_run('\n')
-                    par.runs[-1].text = par.runs[-1].text.rstrip()
+            path = '/'.join(f_ww['path'])
+            if not onto_path:
+                onto_path = path
+                onto_runs.append([f'onto: {path}', 'freq', None])
+            elif path != onto_path:
+                runs.append([f', onto: {path}', 'freq', None])
 
-    doc.save(words_file)
+            if 'sentences' in f_ww:
+                runs.append(['\n\t', None, None])
+                for sent in f_ww['sentences']:
+                    runs.append(['{'+ ' '.join([s[0] for s in sent]) + '}, ', 'entry', None])
+                runs[-1][0] = runs[-1][0].rstrip().rstrip(',')
+            runs.append(['\n', None, None])
+        runs[-1][0] = runs[-1][0].rstrip()
+        blocks.append(('paragraph', runs))
+    return blocks
 
 
 def gather_total_data(onto_path):
@@ -286,90 +364,108 @@ def gather_lesson_data(onto_path):
     # group ontos belonging to the same lesson
     levels = defaultdict(list)
     for f in sorted(list(onto_path.glob('*.yaml'))):
-        lesson, _ = f.stem.split('-')
+        lesson = f.stem.split('-')[0]
         levels[lesson].append(f)
 
-    # generate one onto for each lesson
-    all_ontos = []
-    for l, ontos in levels.items():
-        om = None
+    # the vocabulary of the previous lessons is accumulated lesson after lesson
+    previous = CumulativeVocab()
+    report_data = {}
+    for num, (lesson, ontos) in enumerate(levels.items()):
+        # generate one onto for each lesson
+        om = OntoManager()
+        om.onto1.ont_path = ontos[0].parent / (lesson + '_')  # required to merge these ontos
         for onto in ontos:
-            ont = LeavedOnto(onto)
-            if not om:
-                om = OntoManager()
-                om.onto1.ont_path = f.parent / (l + '_')  # required to merge these ontos
-
-            om.merge_to_onto(ont, in_to_organize=False)
-        all_ontos.append((l, om))
+            om.merge_to_onto(LeavedOnto(onto), in_to_organize=False)
 
-    previous_onto = OntoManager()
-    report_data = {}
-    for num, ao in enumerate(all_ontos):
-        lesson, om = ao
-        if lesson not in report_data:
-            report_data[lesson] = {}
+        report_data[lesson] = {}
 
         # VOCAB TREE
         tree, total_words = om.onto1.export_tree_report()
         report_data[lesson][total_word_count.format(total_words)] = tree
 
         # WORD LISTS
-        # everything is new vocab
-        if num == 0:
-            # gather data
-            entries = om.onto1.ont.find_entries()
+        entries = previous.lesson_entries(om.onto1)
+        current_only, common, previous_only = previous.split(entries)
+        previous.add(entries)
 
-            # organize it for report
-            report_data[lesson][new] = {}
-            for p, e in entries:
-                filtered_fields = []
-                for entry in e:
-                    filtered_fields.append(get_selected_fields(om, entry))
-                report_data[lesson][new]['/'.join(p)] = filtered_fields
+        # everything is new vocab in the first lesson
+        report_data[lesson][new] = {}
+        for p, e in current_only:
+            title = '/'.join(p)
+            if title not in report_data[lesson][new]:
+                report_data[lesson][new][title] = []
 
-        # split words of lesson in: New, Shared, Unseen
-        else:
-            # gather data
-            previous_onto.merge_to_onto(all_ontos[num-1][1].onto1, add_origin=False)
-            current_only, common, previous_only = om.diff_ontos(previous_onto.onto1)
+            report_data[lesson][new][title].append(get_selected_fields(om, e))
 
-            # organize it for report
-            report_data[lesson][new] = {}
-            for p, e in current_only:
-                title = '/'.join(p)
-                if title not in report_data[lesson][new]:
-                    report_data[lesson][new][title] = []
-
-                report_data[lesson][new][title].append(get_selected_fields(om, e))
+        if num == 0:
+            continue
 
-            report_data[lesson][shared] = {}
-            for c, p in common:
-                title = '/'.join(c[0])
-                if title not in report_data[lesson][shared]:
-                    report_data[lesson][shared][title] = {cur: [], prev: []}
+        # split words of lesson in: New, Shared, Unseen
+        report_data[lesson][shared] = {}
+        for c, p in common:
+            title = '/'.join(c[0])
+            if title not in report_data[lesson][shared]:
+                report_data[lesson][shared][title] = {cur: [], prev: []}
 
-                report_data[lesson][shared][title][cur].append(get_selected_fields(om, c[1]))
-                report_data[lesson][shared][title][prev].append(get_selected_fields(om, p[1]))
+            report_data[lesson][shared][title][cur].append(get_selected_fields(om, c[1]))
+            report_data[lesson][shared][title][prev].append(get_selected_fields(om, p[1]))
 
-            report_data[lesson][absent] = {}
-            for p, e in previous_only:
-                title = '/'.join(p)
-                if title not in report_data[lesson][absent]:
-                    report_data[lesson][absent][title] = []
+        report_data[lesson][absent] = {}
+        for p, e in previous_only:
+            title = '/'.join(p)
+            if title not in report_data[lesson][absent]:
+                report_data[lesson][absent][title] = []
 
-                report_data[lesson][absent][title].append(get_selected_fields(om, e))
+            report_data[lesson][absent][title].append(get_selected_fields(om, e))
 
     return report_data
 
 
-def gather_word_data(onto_path, vocab_path, tagged_path):
-    word_data = process_n_filter_ontos(onto_path, vocab_path)
-    retrieve_sentences(word_data, tagged_path)
+def gather_word_data(onto_path, vocab_path, tagged_path, cache_file=None, workers=None):
+    # workers: processes parsing the tagged workbooks
+    if not cache_file:
+        word_data = process_n_filter_ontos(onto_path, vocab_path)
+        retrieve_sentences(word_data, parse_tagged_sentences(tagged_path, workers=workers))
+        return word_data
+
+    # only compute again the lessons whose inputs changed
+    cache = ReportCache(cache_file)
+    vocab = parse_vocab(vocab_path)
+    onto_digest = files_digest(sorted(onto_path.glob('*.yaml')))
+    tagged_files = {f.name: f for f in sorted(tagged_path.glob('*.xlsx'))}
+    tagged_digests = {name: file_hash(f) for name, f in tagged_files.items()}
+    changed_files = cache.changed_files(tagged_digests)
+
+    # parse the workbooks that changed first: their sheets may not be the ones the cache knows about
+    files = [tagged_files[name] for name in changed_files if name in tagged_files]
+    sentences = parse_tagged_sentences(tagged_path, files=files, workers=workers)
+    stale = cache.stale_lessons(vocab, onto_digest, changed_files, sentences.files)
+
+    new_data = {}
+    if stale:
+        new_data = process_n_filter_ontos(onto_path, vocab_path, vocab=vocab, lessons=stale)
+
+    # then the unchanged ones the new lessons take their sentences from
+    needed = set()
+    for lessons in new_data.values():
+        for lesson_data in lessons.values():
+            needed.update(lesson_sheets(lesson_data))
+    to_parse = set(cache.sheet_files(needed)) - set(changed_files)
+    files = [f for name, f in tagged_files.items() if name in to_parse]
+    if files:
+        parse_tagged_sentences(tagged_path, files=files, workers=workers, parsed=sentences)
+    retrieve_sentences(new_data, sentences)
+
+    cache.update(vocab, new_data, onto_digest, tagged_digests, sentences.files)
+    cache.save()
+
+    word_data = {}
+    for level, lessons in vocab.items():
+        word_data[level] = {lesson: cache.lesson(level, lesson) for lesson in lessons}
     return word_data
 
 
-def retrieve_sentences(word_data, tagged_path):
-    sentences = parse_tagged_sentences(tagged_path)
+def retrieve_sentences(word_data, sentences):
     for level, lessons in word_data.items():
         for lesson, words in lessons.items():
             for word, occurences in words.items():
@@ -382,86 +478,90 @@ def retrieve_sentences(word_data, tagged_path):
                                 origin = f['origin']
                                 if 'sentences' in origin:
                                     pair = (word, f['POS'])
-                                    for sent in sentences[origin]:
-                                        if pair in sent:
-                                            if 'sentences' not in f:
-                                                f['sentences'] = []
-
-                                            if sent not in f['sentences']:
+                                    found = sentences.find(pair, origin)
+                                    if found:
+                                        if 'sentences' not in f:
+                                            f['sentences'] = []
+
+                                        seen = set(f['sentences'])
+                                        for sent in found:
+                                            if sent not in seen:
+                                                seen.add(sent)
                                                 f['sentences'].append(sent)
 
 
-def process_n_filter_ontos(onto_path, vocab_path):
-    vocab = parse_vocab(vocab_path)
+def process_n_filter_ontos(onto_path, vocab_path, vocab=None, lessons=None):
+    # lessons: only process these (level, lesson) pairs
+    if vocab is None:
+        vocab = parse_vocab(vocab_path)
 
     om = OntoManager()
     for f in sorted(list(onto_path.glob('*.yaml'))):
         om.merge_to_onto(f)
+    index = OntoIndex(om.onto1)
 
     word_data = {}
 
-    for level, lessons in vocab.items():
+    for level, lessons_ in vocab.items():
         if level not in word_data:
             word_data[level] = {}
 
-        for lesson, a in lessons.items():
-            if lesson not in word_data[level]:
-                word_data[level][lesson] = {}
-
-            field_type = a['legend'][2]
-            words = a['words']
-            for word, pos, field in words:
-                if word not in word_data[level][lesson]:
-                    word_data[level][lesson][word] = {}
-
-                # 1. find word in onto
-                results = om.onto1.find_word(word)
-
-                # 2. filter results
-                # 2.a. filter on pos
-                if pos:
-                    results = [(r, entry) for r, entry in results if r[0] == pos]
-                # 2.b. filter on path-within-onto/categorisation
-                if field_type == 'CAT':
-                    if field:
-                        results = [(path, entry) for path, entry in results if '/'.join(path) == field]
-                # 2.c. filter on onto field
-                elif field and field_type in om.onto1.ont.legend:
-                    tmp = []
-                    for path, entries in results:
-                        tmp_res = []
-                        for entry in entries:
-                            if om.onto1.get_field_value(entry, field_type) == field:
-                                tmp_res.append(entry)
-                        if tmp_res:
-                            tmp.append((path, tmp_res))
-                    if tmp:
-                        results = tmp
-                else:
-                    print(f"{field_type} is not a field in the ontology and can't be used to filter the results.")
-
-                # 3. establish usage map of word
-                # 3.1 sanity check: word has not been used in previous lessons
-                for path, entries in results:
-                    for entry in entries:
-                        origins = om.onto1.get_field_value(entry, 'origin').split(' — ')
-                        for o in origins:
-                            filename, freq = o.split(':')
-                            freq = int(freq)
-                            o_lesson = filename.split('-')[0]
-                            if o_lesson < lesson:
-                                if 'sanity' not in word_data[level][lesson][word]:
-                                    word_data[level][lesson][word]['sanity'] = []
-
-                                word_data[level][lesson][word]['sanity'].append({'POS': pos, 'path': path, 'origin': filename, 'freq': freq})
-                            else:
-                                if 'occurences' not in word_data[level][lesson][word]:
-                                    word_data[level][lesson][word]['occurences'] = {'freq': 0}
-
-                                if o_lesson not in word_data[level][lesson][word]['occurences']:
-                                    word_data[level][lesson][word]['occurences'][o_lesson] = {'freq': 0, 'files': []}
-
-                                word_data[level][lesson][word]['occurences'][o_lesson]['files'].append({'POS': pos, 'path': path, 'origin': filename, 'freq': freq})
-                                word_data[level][lesson][word]['occurences']['freq'] += freq
-                                word_data[level][lesson][word]['occurences'][o_lesson]['freq'] += freq
+        for lesson, a in lessons_.items():
+            if lessons is not None and (level, lesson) not in lessons:
+                continue
+            word_data[level][lesson] = filter_lesson_words(om, index, lesson, a)
     return word_data
+
+
+def filter_lesson_words(om, index, lesson, a):
+    lesson_data = {}
+    field_type = a['legend'][2]
+    words = a['words']
+
+    # 1. find the words of the lesson in onto
+    # 2. filter results
+    # 2.a. filter on pos
+    # 2.b. filter on path-within-onto/categorisation
+    # 2.c. filter on onto field, falling back on unfiltered results if nothing matches
+    queries = []
+    for word, pos, field in words:
+        if field_type == 'CAT':
+            queries.append((word, pos, field, None))
+        elif field and field_type in om.onto1.ont.legend:
+            queries.append((word, pos, None, {field_type: field}))
+        else:
+            print(f"{field_type} is not a field in the ontology and can't be used to filter the results.")
+            queries.append((word, pos, None, None))
+    results = index.find_rows(queries)
+    unfiltered = [n for n, q in enumerate(queries) if q[3] and not results[n]]
+    if unfiltered:
+        fallback = index.find_rows([(queries[n][0], queries[n][1], None, None) for n in unfiltered])
+        for n, rows in zip(unfiltered, fallback):
+            results[n] = rows
+
+    # 3. establish usage map of word
+    # 3.1 sanity check: word has not been used in previous lessons
+    rank = index.origins.rank(lesson)
+    for (word, pos, field), rows in zip(words, results):
+        if word not in lesson_data:
+            lesson_data[word] = {}
+
+        for row in rows:
+            path = index.rows[row][0]
+            for filename, o_lesson, o_rank, freq in index.origins.records(index.origin_col[row]):
+                if o_rank < rank:
+                    if 'sanity' not in lesson_data[word]:
+                        lesson_data[word]['sanity'] = []
+
+                    lesson_data[word]['sanity'].append({'POS': pos, 'path': path, 'origin': filename, 'freq': freq})
+                else:
+                    if 'occurences' not in lesson_data[word]:
+                        lesson_data[word]['occurences'] = {'freq': 0}
+
+                    if o_lesson not in lesson_data[word]['occurences']:
+                        lesson_data[word]['occurences'][o_lesson] = {'freq': 0, 'files': []}
+
+                    lesson_data[word]['occurences'][o_lesson]['files'].append({'POS': pos, 'path': path, 'origin': filename, 'freq': freq})
+                    lesson_data[word]['occurences']['freq'] += freq
+                    lesson_data[word]['occurences'][o_lesson]['freq'] += freq
+    return lesson_data
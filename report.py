@@ -1,10 +1,13 @@
 from pathlib import Path
 
-from level_packs import gen_vocab_report
+from level_packs import gen_vocab_report, read_config
 
 
-onto = Path('content/ontos/A0')
-out_path = Path('content/')
-vocab_path = Path('content/level_vocab.xlsx')
-tagged_path = Path('content/A0/5 to-tag/')
-gen_vocab_report(onto, out_path, vocab_path, tagged_path)
+if __name__ == "__main__":
+    # the number of worker processes is set in config.yaml, under workers: report
+    mode, lang, content, driver_folders, level_colors, pos, levels, legend, line_mode, workers, profile, native = read_config()
+    onto = Path('content/ontos/A0')
+    out_path = Path('content/')
+    vocab_path = Path('content/level_vocab.xlsx')
+    tagged_path = Path('content/A0/5 to-tag/')
+    gen_vocab_report(onto, out_path, vocab_path, tagged_path, workers=(workers or {}).get('report'))
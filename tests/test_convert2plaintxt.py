@@ -0,0 +1,21 @@
+from pathlib import Path
+
+import pytest
+
+from level_packs.convert2plaintxt import docx2lines
+
+# small docx files with the lines parse_md() gives for their pandoc conversion (pandoc 3.9).
+# to write the .txt files again with the installed pandoc:
+#   python benchmarks/check_docx2lines.py tests/fixtures/docx2lines --golden tests/fixtures/docx2lines --update
+FIXTURES = Path(__file__).parent / 'fixtures' / 'docx2lines'
+
+
+@pytest.mark.parametrize('name', ['paragraphs', 'runs'])
+def test_docx2lines_gives_the_pandoc_lines(name):
+    expected = (FIXTURES / f'{name}.txt').read_text(encoding='utf-8').split('\n')
+    assert docx2lines(FIXTURES / f'{name}.docx') == expected
+
+
+@pytest.mark.parametrize('name', ['table', 'list'])
+def test_docx2lines_leaves_tables_and_lists_to_pandoc(name):
+    assert docx2lines(FIXTURES / f'{name}.docx') is None
@@ -0,0 +1,75 @@
+import pytest
+
+from level_packs.corpus_segment import Tokenizer, load_tok_snapshot, tokenize_line_bo
+
+
+def make_dialect(base, words):
+    dialect = base / 'general'
+    for folder in ['dictionary/words', 'dictionary/rules', 'dictionary/words_non_inflected', 'adjustments/words', 'adjustments/rules']:
+        (dialect / folder).mkdir(parents=True, exist_ok=True)
+    (dialect / 'dictionary' / 'words' / 'words.tsv').write_text(''.join(f'{w}\tNOUN\n' for w in words))
+    (dialect / 'dictionary' / 'words_non_inflected' / 'particles.tsv').write_text('')
+    return dialect
+
+
+def test_snapshot_follows_dialect_edits(tmp_path):
+    base = tmp_path / 'tok_data'
+    snapshot = tmp_path / 'general_tokenizer.snapshot'
+    dialect = make_dialect(base, ['བཀྲ', 'ཤིས'])
+    tok = load_tok_snapshot(snapshot, 'general', base)
+    assert tokenize_line_bo(tok, 'བཀྲ་ཤིས་') == 'བཀྲ་ ཤིས་'
+
+    (dialect / 'dictionary' / 'words' / 'words.tsv').write_text('བཀྲ\tNOUN\nཤིས\tNOUN\nབཀྲ་ཤིས\tNOUN\n')
+    tok = load_tok_snapshot(snapshot, 'general', base)
+    assert tokenize_line_bo(tok, 'བཀྲ་ཤིས་') == 'བཀྲ་ཤིས་'
+
+
+class Interrupted(Exception):
+    pass
+
+
+def fake_tokenizer(fail_at=None):
+    # a Tokenizer whose segmentation upper-cases the lines, interrupted at the fail_at-th chunk
+    T = Tokenizer.__new__(Tokenizer)
+    T.rules = None
+    T.cache = None
+    calls = []
+
+    def tokenize(tok, text, rules=None, cache=None):
+        calls.append(text)
+        if len(calls) == fail_at:
+            raise Interrupted
+        return text.upper()
+
+    T.tokenize = tokenize
+    return T
+
+
+def crash(in_file, out_file):
+    with pytest.raises(Interrupted):
+        fake_tokenizer(fail_at=3).tok_file_stream(None, in_file, out_file, chunk_size=10, resume=True)
+    assert not out_file.is_file()
+
+
+def test_stream_resumes_after_a_crash(tmp_path):
+    in_file, out_file = tmp_path / 'a_tosegment.txt', tmp_path / 'a_segmented.txt'
+    in_file.write_text('\n'.join(f'line {n}' for n in range(45)) + '\n')
+    crash(in_file, out_file)
+
+    T = fake_tokenizer()
+    T.tok_file_stream(None, in_file, out_file, chunk_size=10, resume=True)
+    assert out_file.read_text() == in_file.read_text().upper()
+    assert not (tmp_path / 'a_segmented.txt.part').exists()
+    assert not (tmp_path / 'a_segmented.txt.progress').exists()
+
+
+def test_stream_restarts_when_the_input_changed_after_a_crash(tmp_path):
+    in_file, out_file = tmp_path / 'a_tosegment.txt', tmp_path / 'a_segmented.txt'
+    in_file.write_text('\n'.join(f'line {n}' for n in range(45)) + '\n')
+    crash(in_file, out_file)
+
+    # same size, so only the content tells the inputs apart
+    in_file.write_text('\n'.join(f'edit {n}' for n in range(45)) + '\n')
+    T = fake_tokenizer()
+    T.tok_file_stream(None, in_file, out_file, chunk_size=10, resume=True)
+    assert out_file.read_text() == in_file.read_text().upper()
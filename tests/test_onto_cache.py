@@ -0,0 +1,47 @@
+from level_packs import onto_cache
+
+
+class FakeManager:
+    # records the merges instead of doing them
+    batch_merges = 0
+
+    def __init__(self):
+        self.merged = []
+
+    def batch_merge_to_onto(self, ontos):
+        FakeManager.batch_merges += 1
+        self.merged.extend(f.name for f in ontos)
+
+    def merge_to_onto(self, onto):
+        self.merged.append(onto.name)
+
+
+def test_regenerated_partial_onto_reuses_the_merge(tmp_path, monkeypatch):
+    monkeypatch.setattr(onto_cache, 'OntoManager', FakeManager)
+    monkeypatch.setattr(onto_cache, '_merged', {})
+    monkeypatch.setattr(FakeManager, 'batch_merges', 0)
+    finalized = tmp_path / 'ontos'
+    current = finalized / 'A0'
+    current.mkdir(parents=True)
+    (current / '1-1_onto.yaml').write_text('a')
+
+    om = onto_cache.merge_finalized_ontos(finalized, current)
+    assert om.merged == ['1-1_onto.yaml']
+    assert FakeManager.batch_merges == 1
+
+    # the to-tag step writes the partial onto of the file it is working on, then merges again
+    (current / '1-2_partial.yaml').write_text('b')
+    om = onto_cache.merge_finalized_ontos(finalized, current)
+    assert om.merged == ['1-1_onto.yaml', '1-2_partial.yaml']
+    assert FakeManager.batch_merges == 1
+
+    (current / '1-2_partial.yaml').write_text('bc')
+    om = onto_cache.merge_finalized_ontos(finalized, current)
+    assert om.merged == ['1-1_onto.yaml', '1-2_partial.yaml']
+    assert FakeManager.batch_merges == 1
+
+    # a new onto of the level is a new merge
+    (current / '1-2_onto.yaml').write_text('d')
+    om = onto_cache.merge_finalized_ontos(finalized, current)
+    assert om.merged == ['1-1_onto.yaml', '1-2_onto.yaml', '1-2_partial.yaml']
+    assert FakeManager.batch_merges == 2
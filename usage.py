@@ -1,6 +1,11 @@
+import argparse
+
 from level_packs import create_packs
 
 
 if __name__ == "__main__":
     # set params in config.yaml
-    create_packs()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true", help="list what would be rebuilt without doing it")
+    args = parser.parse_args()
+    create_packs(dry_run=args.dry_run)